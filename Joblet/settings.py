@@ -135,4 +135,24 @@ LOGIN_REDIRECT_URL = 'index'
 LOGOUT_REDIRECT_URL = 'login'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Pub/sub backend behind the live notification stream. LocalBroker only reaches
+# clients connected to the same process; use app.pubsub.RedisBroker (requires
+# the redis package) when running several ASGI workers.
+PUBSUB_BACKEND = os.environ.get('PUBSUB_BACKEND', 'app.pubsub.LocalBroker')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+# Cache shared by every worker process. The anonymous page cache
+# (app/page_cache.py) and the category facets (app/facets.py) are invalidated
+# by changing cache keys, which only reaches other workers through a shared
+# backend. The database cache needs no
+# extra service (its table is created on migrate); set CACHE_BACKEND to
+# django.core.cache.backends.redis.RedisCache (requires the redis package) to
+# use REDIS_URL instead.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': REDIS_URL if CACHE_BACKEND.endswith('.RedisCache') else 'joblet_cache',
+    }
+}
@@ -34,6 +34,7 @@ urlpatterns = [
     path('services/', views.services, name='services'),
     path('service/<int:service_id>/', views.service_detail, name='service_detail'),
     path('service/<int:service_id>/book/', views.book_service, name='book_service'),
+    path('service/<int:service_id>/slots/', views.service_slots, name='service_slots'),
     path('booking/', views.booking, name='booking'),
     path('myorders/', views.myorders, name='myorders'),
     path('myservices/', views.myservices, name='myservices'),
@@ -41,6 +42,7 @@ urlpatterns = [
     path('myservices/delete/<int:service_id>/', views.delete_service, name='delete_service'),
     path('myservices/new/', views.add_service, name='add_service'),
     path('myservices/edit/<int:service_id>/json/', views.get_service_data, name='get_service_data'),
+    path('myservices/stats/', views.provider_booking_stats, name='provider_booking_stats'),
 
     # Admin
     path('categories/', views.categories, name='categories'),
@@ -58,10 +60,14 @@ urlpatterns = [
 
     # Chat
     path('booking/<int:booking_id>/chat/', views.chat_view, name='chat_view'),
+    path('booking/<int:booking_id>/chat/messages/', views.chat_messages, name='chat_messages'),
+    path('booking/<int:booking_id>/chat/send/', views.chat_send, name='chat_send'),
+    path('booking/<int:booking_id>/chat/stream/', views.chat_stream, name='chat_stream'),
     path('chats/', views.user_chats, name='user_chats'),
 
     # Notifications
     path('notifications/', views.notifications, name='notifications'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     path('notifications/mark-as-read/<int:notification_id>/', views.mark_notification_as_read,
          name='mark_notification_as_read'),
     # Bookings
@@ -2,13 +2,18 @@ from django.contrib import admin
 from django import forms
 from django.utils.dateparse import parse_datetime
 
+from app.facets import invalidate_category_facets
+from app.page_cache import bump_version
 from app.models import *
 
 admin.site.register(Review)
 admin.site.register(Chat)
 admin.site.register(Message)
-admin.site.register(Provider)
 admin.site.register(Notification)
+admin.site.register(SiteStatistics)
+admin.site.register(LeaderboardEntry)
+admin.site.register(BookingDailyRollup)
+admin.site.register(WalletSnapshot)
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -20,6 +25,39 @@ class ProfileAdmin(admin.ModelAdmin):
         ('Contact Details', {'fields': ('phone', 'location')}),
         ('Financial Info', {'fields': ('wallet',)}),
     )
+    # Balances only change through the ledger, see app/wallet.py
+    readonly_fields = ('wallet',)
+
+
+@admin.register(WalletTransaction)
+class WalletTransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'profile', 'kind', 'amount', 'booking', 'created_at')
+    list_select_related = ('profile__user',)
+    list_filter = ('kind',)
+    search_fields = ('profile__user__username',)
+
+    # The ledger is append-only, and entries are only written together with the balance
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class WorkingHoursInline(admin.TabularInline):
+    model = WorkingHours
+    extra = 0
+
+
+@admin.register(Provider)
+class ProviderAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'rating_average', 'rating_count')
+    list_select_related = ('profile__user',)
+    search_fields = ('profile__user__username',)
+    inlines = [WorkingHoursInline]
 
 
 class BookingInline(admin.TabularInline):
@@ -44,6 +82,9 @@ class ServiceAdmin(admin.ModelAdmin):
 
     def approve_services(self, request, queryset):
         queryset.update(approval='approved')
+        # update() skips the Service signals
+        invalidate_category_facets()
+        bump_version()
         self.message_user(request, f"{queryset.count()} services approved.")
     approve_services.short_description = "Approve selected services"
 
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Booking, Provider, WorkingHours
+
+# Used for providers who haven't set any working hours: weekdays, 9 to 6
+DEFAULT_WORKING_HOURS = {weekday: [(time(9), time(18))] for weekday in range(5)}
+# Slots start on multiples of this from the opening time
+SLOT_STEP = timedelta(minutes=30)
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def working_hours(provider_id):
+    """The provider's working hours as {weekday: [(opens, closes), ...]}, in local time."""
+    hours = defaultdict(list)
+    for weekday, opens, closes in WorkingHours.objects.filter(provider_id=provider_id).values_list('weekday', 'opens', 'closes'):
+        hours[weekday].append((opens, closes))
+    return dict(hours) or DEFAULT_WORKING_HOURS
+
+
+def blocking_bookings(provider_id, start, end):
+    """
+    The provider's pending and in-progress bookings that overlap [start, end).
+    Each of the provider's services and blocking statuses is a range scan of
+    booking_interval_idx.
+    """
+    return Booking.objects.filter(
+        service__provider_id=provider_id,
+        status__in=Booking.BLOCKING_STATUSES,
+        ends_at__gt=start,
+        scheduled_time__lt=end,
+    )
+
+
+def busy_intervals(provider_id, start, end, exclude=None):
+    """(scheduled_time, ends_at) of blocking_bookings(), in order."""
+    blocking = blocking_bookings(provider_id, start, end)
+    if exclude is not None:
+        blocking = blocking.exclude(pk=exclude)
+    return sorted(blocking.values_list('scheduled_time', 'ends_at'))
+
+
+def _periods(hours, day):
+    local = timezone.get_current_timezone()
+    for opens, closes in sorted(hours.get(day.weekday(), [])):
+        yield (timezone.make_aware(datetime.combine(day, opens), local),
+               timezone.make_aware(datetime.combine(day, closes), local))
+
+
+def within_working_hours(hours, start, end):
+    day = timezone.localtime(start).date()
+    return any(opens <= start and end <= closes for opens, closes in _periods(hours, day))
+
+
+def open_slots(service, first_day, days):
+    """
+    Start times at which `service` can still be booked, from `first_day` for
+    `days` days, as {date: [start, ...]}. A slot is open if the whole booking
+    fits in the provider's working hours and overlaps none of their blocking
+    bookings, on any of their services.
+    """
+    hours = working_hours(service.provider_id)
+    local = timezone.get_current_timezone()
+    window_start = timezone.make_aware(datetime.combine(first_day, time.min), local)
+    window_end = timezone.make_aware(datetime.combine(first_day + timedelta(days=days), time.min), local)
+    busy = busy_intervals(service.provider_id, window_start, window_end)
+    earliest = timezone.now()
+
+    slots = {}
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        slots[day] = []
+        for opens, closes in _periods(hours, day):
+            start = opens
+            while start + service.duration <= closes:
+                end = start + service.duration
+                if start >= earliest and not any(busy_start < end and start < busy_end for busy_start, busy_end in busy):
+                    slots[day].append(start)
+                start += SLOT_STEP
+    return slots
+
+
+def reserve(booking):
+    """
+    Raises SlotUnavailable unless `booking`, already saved, fits in the
+    provider's working hours and overlaps none of their other blocking
+    bookings. Call it in the transaction that saved the booking, so a
+    conflicting booking rolls back with it.
+    """
+    provider_id = booking.service.provider_id
+    if not within_working_hours(working_hours(provider_id), booking.scheduled_time, booking.ends_at):
+        raise SlotUnavailable("The provider doesn't work at that time.")
+
+    # Serializes bookings for the same provider. SQLite has no row locks, but
+    # there the INSERT of `booking` already holds the database's write lock.
+    Provider.objects.select_for_update().only('pk').get(pk=provider_id)
+    if busy_intervals(provider_id, booking.scheduled_time, booking.ends_at, exclude=booking.pk):
+        raise SlotUnavailable("The provider already has a booking at that time.")
@@ -0,0 +1,100 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Queued items still waiting when the process exits get this long to be written
+SHUTDOWN_FLUSH_TIMEOUT = 10
+
+
+class BatchWriter:
+    """
+    In-process queue drained by a background thread, which hands the items to
+    `write` in batches of up to `batch_size`. After taking the first item the
+    thread waits up to `batch_wait` seconds for more to join the batch.
+
+    Items still queued when the process is killed are lost; a normal shutdown
+    drains the queue first.
+
+    With `retries`, a batch that fails to write (e.g. "database is locked")
+    is tried again that many times, then item by item, so one bad item
+    doesn't take the rest of the batch with it; only items that still fail
+    on their own are dropped. `write` must then leave nothing behind when
+    it raises, so trying again can't write anything twice.
+    """
+
+    def __init__(self, name, write, batch_size=200, batch_wait=0.05, retries=0, retry_delay=0.1):
+        self.name = name
+        self.write = write
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        atexit.register(self.flush, SHUTDOWN_FLUSH_TIMEOUT)
+
+    def put(self, items):
+        self._start_worker()
+        for item in items:
+            self._queue.put(item)
+
+    def flush(self, timeout=None):
+        """Blocks until every queued item has been written. Returns False on timeout."""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            finally:
+                connection.close()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        try:
+            self._write_with_retries(batch)
+        except Exception:
+            if not self.retries or len(batch) == 1:
+                logger.exception("%s failed to write %d queued items", self.name, len(batch))
+                return
+            logger.warning("%s failed to write a batch of %d items, writing them one at a time",
+                           self.name, len(batch), exc_info=True)
+            for item in batch:
+                try:
+                    self._write_with_retries([item])
+                except Exception:
+                    logger.exception("%s dropped a queued item it couldn't write: %r", self.name, item)
+
+    def _write_with_retries(self, items):
+        for attempt in range(self.retries + 1):
+            try:
+                self.write(items)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                # Start over on a fresh connection, after a growing pause
+                connection.close()
+                time.sleep(self.retry_delay * 2 ** attempt)
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from . import page_cache, popularity, rollups, site_stats, wallet
+from .models import Booking, Chat
+from .notifications import dispatch
+
+# Allowed status changes: action -> (from status, to status, timestamp field)
+TRANSITIONS = {
+    'accept': ('pending', 'in_progress', 'accepted_at'),
+    'reject': ('pending', 'cancelled', 'cancelled_at'),
+    'complete': ('in_progress', 'completed', 'completed_at'),
+}
+
+
+def record_status_change(booking, old_status, new_status):
+    """
+    Keeps the counters and rollups derived from booking statuses in step, and
+    opens the chat once a booking is in progress. Runs for transitions made
+    here and for plain saves (see signals.track_booking_status).
+    """
+    popularity.record_booking_status(booking.service_id, old_status, new_status)
+    site_stats.record_booking_status(booking.service_id, old_status, new_status)
+    rollups.record_booking_status(booking, new_status)
+    if new_status == 'in_progress':
+        Chat.objects.get_or_create(booking=booking)
+
+
+def transition(booking, action):
+    """
+    Moves `booking` through `action` with a single conditional
+    UPDATE ... WHERE id = ? AND status = ?, so of several concurrent attempts
+    exactly one wins. Only the winner runs the side effects. Returns whether
+    this call made the change; on False, booking.status is refreshed so the
+    caller can tell why.
+
+    `booking` should come with its service, the service's provider profile
+    and the customer loaded, the side effects use them.
+    """
+    source, target, timestamp_field = TRANSITIONS[action]
+    now = timezone.now()
+    with transaction.atomic():
+        won = Booking.objects.filter(pk=booking.pk, status=source).update(status=target, **{timestamp_field: now})
+        if not won:
+            booking.status = Booking.objects.filter(pk=booking.pk).values_list('status', flat=True).first()
+            booking._saved_status = booking.status
+            return False
+
+        booking.status = target
+        booking._saved_status = target
+        setattr(booking, timestamp_field, now)
+        # update() skips the Booking signals, so do their work here
+        record_status_change(booking, source, target)
+        SIDE_EFFECTS[action](booking)
+    page_cache.bump_version()
+    return True
+
+
+def _accepted(booking):
+    dispatch(
+        recipients=booking.customer,
+        message=f"Your request for the service '{booking.service.title}' has been accepted by the provider and is now in progress.",
+        url=reverse('myorders'),
+    )
+
+
+def _rejected(booking):
+    wallet.refund(booking.customer, wallet.amount_paid(booking), booking=booking)
+    dispatch(
+        recipients=booking.customer,
+        message=f"Your request for the service '{booking.service.title}' was rejected by the provider.",
+        url=reverse('myorders'),
+    )
+
+
+def _completed(booking):
+    provider_profile = booking.service.provider.profile
+    wallet.pay_out(provider_profile, wallet.amount_paid(booking), booking=booking)
+    dispatch(
+        recipients=provider_profile,
+        message=f"The booking for the service '{booking.service.title}' has been marked as completed by the customer.",
+    )
+
+
+SIDE_EFFECTS = {
+    'accept': _accepted,
+    'reject': _rejected,
+    'complete': _completed,
+}
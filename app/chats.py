@@ -0,0 +1,172 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import date_format
+
+from . import pubsub
+from .batching import BatchWriter
+from .models import Chat, Message
+from .notifications import dispatch
+
+logger = logging.getLogger(__name__)
+
+# Messages shown when a chat is opened, and per history/update request
+CHAT_PAGE_SIZE = 50
+# Messages sent through views.chat_send are saved by a background worker, this many per INSERT
+MESSAGE_BATCH_SIZE = 100
+# Times a batch that failed to save is tried again before saving its messages one by one
+MESSAGE_WRITE_RETRIES = 2
+
+MESSAGE_FIELDS = ('id', 'chat_id', 'content', 'timestamp', 'sender__user__username')
+
+
+def is_participant(booking, profile):
+    """Only the booking's customer and the service's provider may use its chat."""
+    return profile.pk in (booking.customer_id, booking.service.provider.profile_id)
+
+
+def message_window(chat, after=None, before=None, limit=CHAT_PAGE_SIZE):
+    """
+    Up to `limit` messages of `chat`, oldest first: the ones right after
+    message id `after`, the ones right before message id `before`, or the
+    latest ones. Returns (messages, has_more), where `has_more` tells whether
+    more messages exist beyond the window in the direction being read.
+    """
+    messages = chat.messages.select_related('sender__user').only(*MESSAGE_FIELDS)
+    if after is not None:
+        rows = list(messages.filter(id__gt=after).order_by('id')[:limit + 1])
+        return rows[:limit], len(rows) > limit
+
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    rows = list(messages.order_by('-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
+
+
+def active_chats(profile):
+    """
+    The profile's chats on in-progress bookings, as customer or provider, in
+    one query. Each chat is annotated with `unread_count` (messages to
+    `profile` not read yet) and its last message's `last_message_content`,
+    `last_message_at` and `last_message_sender`. Most recent activity first.
+    """
+    unread = (
+        Message.objects.filter(chat=OuterRef('pk'), recipient=profile, is_read=False)
+        .order_by().values('chat').annotate(total=Count('id')).values('total')
+    )
+    last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-id')
+    return (
+        Chat.objects.filter(
+            Q(booking__customer=profile) | Q(booking__service__provider__profile=profile),
+            booking__status='in_progress',
+        )
+        .select_related('booking__customer__user', 'booking__service__provider__profile__user')
+        .annotate(
+            unread_count=Coalesce(Subquery(unread), 0),
+            last_message_content=Subquery(last_message.values('content')[:1]),
+            last_message_at=Subquery(last_message.values('timestamp')[:1]),
+            last_message_sender=Subquery(last_message.values('sender__user__username')[:1]),
+        )
+        .order_by(Coalesce('last_message_at', 'created_at').desc(), '-id')
+    )
+
+
+def mark_read(chat, profile):
+    """Marks every message `profile` received in `chat` as read, in one UPDATE."""
+    return Message.objects.filter(chat=chat, recipient=profile, is_read=False).update(is_read=True)
+
+
+def serialize_message(message, sender_username=None):
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender': sender_username or message.sender.user.username,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+        'display_time': date_format(timezone.localtime(message.timestamp), 'M d, Y H:i'),
+    }
+
+
+def chat_channel(chat_id):
+    return f'chat:{chat_id}'
+
+
+def other_participant(booking, profile):
+    return booking.service.provider.profile if profile.pk == booking.customer_id else booking.customer
+
+
+def publish_message(message, sender_username):
+    """Pushes a saved message to everyone streaming its chat (see views.chat_stream)."""
+    try:
+        pubsub.publish(chat_channel(message.chat_id), {
+            'event': 'message',
+            'data': serialize_message(message, sender_username),
+        })
+    except Exception:
+        # Clients that miss it pick it up with their next ?after= fetch
+        logger.exception("Failed to publish chat message %s", message.id)
+
+
+def notify_recipient(booking_id, chat_id, recipient_id, sender_username, service_title):
+    dispatch(
+        recipients=recipient_id,
+        message=f"{sender_username} sent a new message in the chat for the service '{service_title}'.",
+        url=reverse('chat_view', kwargs={'booking_id': booking_id}),
+        collapse_key=f"chat:{chat_id}",
+    )
+
+
+def send_message(booking, chat, sender, content):
+    """
+    Queues a message from `sender` to the other participant of `booking`.
+    It is saved in the next batch, then published to the chat channel and
+    notified to the recipient.
+    """
+    recipient = other_participant(booking, sender)
+    _writer.put([{
+        'chat_id': chat.id,
+        'booking_id': booking.id,
+        'sender_id': sender.pk,
+        'sender_username': sender.user.username,
+        'recipient_id': recipient.pk,
+        'service_title': booking.service.title,
+        'content': content,
+    }])
+
+
+def write_messages(events):
+    """
+    Saves a batch of queued messages in one transaction, then publishes and
+    notifies them. Raises only if nothing was saved, so the batch writer can
+    safely try again (see BatchWriter).
+    """
+    with transaction.atomic():
+        messages = Message.objects.bulk_create([
+            # bulk_create doesn't call save(), so the conversation key is set here
+            Message(chat_id=event['chat_id'], sender_id=event['sender_id'],
+                    recipient_id=event['recipient_id'], content=event['content'],
+                    conversation=Message.conversation_key(event['sender_id'], event['recipient_id']))
+            for event in events
+        ])
+    for message, event in zip(messages, events):
+        publish_message(message, event['sender_username'])
+        try:
+            notify_recipient(event['booking_id'], event['chat_id'], event['recipient_id'],
+                             event['sender_username'], event['service_title'])
+        except Exception:
+            logger.exception("Failed to notify the recipient of chat message %s", message.id)
+
+
+def flush(timeout=None):
+    """Blocks until every queued message has been saved. Returns False on timeout."""
+    return _writer.flush(timeout)
+
+
+_writer = BatchWriter('chat-messages', write_messages, batch_size=MESSAGE_BATCH_SIZE, retries=MESSAGE_WRITE_RETRIES)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose entries live inside each worker process
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The page cache and the category facets are invalidated by changing cache
+    keys, which other workers only see through a cache they share.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            "The default cache is local to each process.",
+            hint="With several workers, cached pages and category counts go stale in all but "
+                 "the one that handled a change. Use a shared backend (see CACHES in settings.py).",
+            id='app.W001',
+        )]
+    return []
@@ -2,7 +2,6 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from .models import Category
 from .views import categories
-from .models import Notification
 
 
 def category_list(request):
@@ -13,7 +12,8 @@ def category_list(request):
 def unread_notifications_count(request):
     if request.user.is_authenticated:
         try:
-            unread_count = Notification.objects.filter(recipient=request.user.profile, read=False).count()
+            # Denormalized counter, the layout already loads the profile
+            unread_count = request.user.profile.unread_notifications_count
         except ObjectDoesNotExist:
             unread_count = 0
         return {'unread_notifications_count': unread_count}
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db.models import Count
+
+# Facet counts of the unfiltered services listing. Dropped by the Service
+# signals whenever a service is created, approved, rejected, (de)activated
+# or deleted; every worker sees that only because CACHES in settings.py is
+# shared between them (see also checks.py).
+CATEGORY_FACETS_CACHE_KEY = 'services:category_facets'
+CATEGORY_FACETS_TIMEOUT = 60 * 60
+
+
+def count_by_category(queryset):
+    """Counts the services of `queryset` per category with one GROUP BY query."""
+    rows = queryset.order_by().values('category_id').annotate(count=Count('id'))
+    return {row['category_id']: row['count'] for row in rows}
+
+
+def category_facet_counts(queryset, cacheable=False):
+    """
+    Returns {category_id: number of services} for `queryset`. Pass
+    cacheable=True only for the unfiltered listing, whose counts are shared
+    by every visitor.
+    """
+    if not cacheable:
+        return count_by_category(queryset)
+
+    counts = cache.get(CATEGORY_FACETS_CACHE_KEY)
+    if counts is None:
+        counts = count_by_category(queryset)
+        cache.set(CATEGORY_FACETS_CACHE_KEY, counts, CATEGORY_FACETS_TIMEOUT)
+    return counts
+
+
+def invalidate_category_facets():
+    cache.delete(CATEGORY_FACETS_CACHE_KEY)
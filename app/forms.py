@@ -72,6 +72,14 @@ class ProfileForm(forms.ModelForm):
             }),
         }
 
+    def save(self, commit=True):
+        profile = super().save(commit=False)
+        if commit:
+            # Only the edited columns: the wallet and counters may have changed since the form was loaded
+            profile.save(update_fields=self._meta.fields)
+        return profile
+
+
 class ProviderForm(forms.ModelForm):
     avatar = forms.ImageField(required=False, widget=forms.FileInput(attrs={
         'class': 'file-input file-input-bordered w-full',
@@ -131,8 +139,9 @@ class ProviderForm(forms.ModelForm):
         profile.location = self.cleaned_data.get('location')
 
         if commit:
-            profile.save()
-            provider.save()
+            # Only the edited columns: the wallet and counters may have changed since the form was loaded
+            profile.save(update_fields=['avatar', 'phone', 'location'])
+            provider.save(update_fields=self._meta.fields)
         return provider
 
 class ReviewForm(forms.ModelForm):
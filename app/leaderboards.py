@@ -0,0 +1,130 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q, Max
+from django.utils import timezone
+
+from .models import LeaderboardEntry, Provider, Category
+
+logger = logging.getLogger(__name__)
+
+# Snapshots older than this are refreshed in the background on the next read
+REFRESH_INTERVAL = timedelta(minutes=15)
+REFRESH_LOCK_KEY = 'leaderboards:refreshing'
+REFRESH_LOCK_TIMEOUT = 5 * 60
+
+# How many rows each snapshot keeps
+SNAPSHOT_SIZE = 10
+
+WINDOWS = {
+    'all': None,
+    '30d': timedelta(days=30),
+    '7d': timedelta(days=7),
+}
+
+
+def _provider_totals(since, completed_only):
+    condition = Q()
+    if completed_only:
+        condition &= Q(services__booking__status='completed')
+    if since:
+        condition &= Q(services__booking__created_at__gte=since)
+    providers = Provider.objects.annotate(total=Count('services__booking', filter=condition))
+    if completed_only:
+        providers = providers.filter(total__gt=0)
+    return providers.order_by('-total', 'id').values_list('id', 'total')[:SNAPSHOT_SIZE]
+
+
+def _category_totals(since):
+    condition = Q(service__booking__created_at__gte=since) if since else Q()
+    categories = Category.objects.annotate(total=Count('service__booking', filter=condition))
+    return categories.order_by('-total', 'id').values_list('id', 'total')[:SNAPSHOT_SIZE]
+
+
+def refresh_leaderboards():
+    """Recomputes every board for every window and swaps the snapshots in one transaction."""
+    refreshed_at = timezone.now()
+    entries = []
+    for window, length in WINDOWS.items():
+        since = refreshed_at - length if length else None
+        boards = {
+            'provider_sales': ('provider_id', _provider_totals(since, completed_only=True)),
+            'provider_bookings': ('provider_id', _provider_totals(since, completed_only=False)),
+            'category_sales': ('category_id', _category_totals(since)),
+        }
+        for board, (key, rows) in boards.items():
+            entries += [
+                LeaderboardEntry(board=board, window=window, rank=rank, total=total,
+                                 refreshed_at=refreshed_at, **{key: object_id})
+                for rank, (object_id, total) in enumerate(rows, start=1)
+            ]
+
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def _refresh_and_release():
+    try:
+        refresh_leaderboards()
+    except Exception:
+        logger.exception("Leaderboard refresh failed")
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+        connection.close()
+
+
+def refresh_in_background():
+    """Starts a refresh on a worker thread, unless one is already running."""
+    if not cache.add(REFRESH_LOCK_KEY, True, REFRESH_LOCK_TIMEOUT):
+        return
+    threading.Thread(target=_refresh_and_release, daemon=True).start()
+
+
+def get_entries(board, window='all', limit=5):
+    """
+    Returns the last snapshot of a board. A stale snapshot is still served
+    while a fresh one is computed in the background; only when no snapshot
+    exists at all is it computed in the request.
+    """
+    related = 'category' if board == 'category_sales' else 'provider__profile__user'
+    entries = list(
+        LeaderboardEntry.objects.filter(board=board, window=window)
+        .select_related(related).order_by('rank')[:limit]
+    )
+
+    if entries:
+        refreshed_at = entries[0].refreshed_at
+    else:
+        # The board may simply be empty, check when the last snapshot was taken
+        refreshed_at = LeaderboardEntry.objects.aggregate(last=Max('refreshed_at'))['last']
+
+    if refreshed_at is None:
+        refresh_leaderboards()
+        return get_entries(board, window, limit) if LeaderboardEntry.objects.exists() else []
+
+    if timezone.now() - refreshed_at > REFRESH_INTERVAL:
+        refresh_in_background()
+    return entries
+
+
+def ranked_providers(board, window='all', limit=5):
+    """Providers of a board in rank order, each with its `total_sales`."""
+    providers = []
+    for entry in get_entries(board, window, limit):
+        entry.provider.total_sales = entry.total
+        providers.append(entry.provider)
+    return providers
+
+
+def ranked_categories(window='all', limit=5):
+    """Categories by number of bookings, each with its `total_sales`."""
+    categories = []
+    for entry in get_entries('category_sales', window, limit):
+        entry.category.total_sales = entry.total
+        categories.append(entry.category)
+    return categories
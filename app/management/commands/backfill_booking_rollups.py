@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.rollups import backfill_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily booking rollup table from the bookings."
+
+    def handle(self, *args, **options):
+        rows = backfill_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily rollup rows."))
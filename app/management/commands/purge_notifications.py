@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.notifications import PURGE_BATCH_SIZE, RETENTION_DAYS, purge_read_notifications
+
+
+class Command(BaseCommand):
+    help = "Deletes read notifications older than their type's retention period, in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retain', action='append', default=[], metavar='TYPE=DAYS',
+            help=f"Overrides the retention of one type ({', '.join(RETENTION_DAYS)}). Can be repeated.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=PURGE_BATCH_SIZE,
+            help="Rows deleted per transaction.",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0, metavar='SECONDS',
+            help="Sleep between batches to leave room for other writers.",
+        )
+
+    def handle(self, *args, **options):
+        retention = {}
+        for value in options['retain']:
+            notification_type, _, days = value.partition('=')
+            if notification_type not in RETENTION_DAYS or not days.isdigit():
+                raise CommandError(f"Invalid --retain value '{value}', expected TYPE=DAYS.")
+            retention[notification_type] = int(days)
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        deleted = purge_read_notifications(retention, options['batch_size'], options['pause'])
+        for notification_type, count in deleted.items():
+            self.stdout.write(f"{notification_type}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Deleted {sum(deleted.values())} read notifications."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized rating aggregates of every provider from the reviews table."
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} providers."))
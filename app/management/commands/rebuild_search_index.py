@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.search import ensure_service_index_triggers, fts_available, rebuild_service_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index for services."
+
+    def handle(self, *args, **options):
+        ensure_service_index_triggers()
+        if not fts_available():
+            self.stdout.write(self.style.WARNING(
+                "The full-text index is not available on this database; search uses the LIKE fallback."
+            ))
+            return
+
+        indexed = rebuild_service_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} services."))
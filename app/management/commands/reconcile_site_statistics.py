@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from app.site_stats import get_site_statistics, reconcile_site_statistics
+
+COUNTERS = (
+    'total_users', 'total_providers', 'total_services',
+    'total_reviews', 'completed_bookings', 'total_revenue',
+)
+
+
+class Command(BaseCommand):
+    help = "Recomputes the home page counters from the source tables and reports any drift."
+
+    def handle(self, *args, **options):
+        before = get_site_statistics()
+        after = reconcile_site_statistics()
+
+        for field in COUNTERS:
+            old, new = getattr(before, field), getattr(after, field)
+            if old != new:
+                self.stdout.write(self.style.WARNING(f"{field}: {old} -> {new}"))
+        self.stdout.write(self.style.SUCCESS("Site statistics reconciled."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.notifications import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = "Recomputes every profile's unread notification counter from the notifications table."
+
+    def handle(self, *args, **options):
+        updated = reconcile_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled unread notification counters for {updated} profiles."))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.leaderboards import refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the leaderboard snapshots (all-time, 30 days and 7 days)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=0, metavar='SECONDS',
+            help="Keep running and refresh every SECONDS seconds instead of once.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            entries = refresh_leaderboards()
+            self.stdout.write(self.style.SUCCESS(f"Refreshed leaderboards ({entries} entries)."))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = "Recomputes the time-decayed popularity score of every service. Run it periodically (e.g. hourly from cron)."
+
+    def handle(self, *args, **options):
+        updated = refresh_popularity()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed popularity for {updated} services."))
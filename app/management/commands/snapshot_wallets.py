@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app.wallet import snapshot_balances
+
+
+class Command(BaseCommand):
+    help = "Snapshots the wallet balance of every profile with new ledger entries and checks it against Profile.wallet."
+
+    def handle(self, *args, **options):
+        taken, mismatched = snapshot_balances()
+        if mismatched:
+            self.stdout.write(self.style.WARNING(
+                f"Wallet doesn't match the ledger for profiles: {', '.join(map(str, mismatched))}"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Took {taken} wallet snapshots."))
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'app_service_fts'
+
+CREATE_STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+    USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    # Rank title matches ten times higher than description matches
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_ai AFTER INSERT ON app_service BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_ad AFTER DELETE ON app_service BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_au AFTER UPDATE OF title, description ON app_service BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title, description = new.description WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description)
+    SELECT id, title, description FROM app_service
+    """,
+]
+
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS app_service_fts_ai",
+    "DROP TRIGGER IF EXISTS app_service_fts_ad",
+    "DROP TRIGGER IF EXISTS app_service_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts_index(apps, schema_editor):
+    # Other backends keep using the LIKE fallback in app/search.py
+    if not fts5_supported(schema_editor.connection):
+        return
+    for statement in CREATE_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_notification_url_alter_service_title'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+import math
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Provider = apps.get_model('app', 'Provider')
+    Review = apps.get_model('app', 'Review')
+
+    for provider in Provider.objects.all():
+        ratings = list(Review.objects.filter(provider=provider).values_list('rating', flat=True))
+        fields = {
+            'rating_count': len(ratings),
+            'rating_sum': sum(ratings, Decimal('0')),
+            'rating_average': (sum(ratings, Decimal('0')) / len(ratings)) if ratings else Decimal('0'),
+        }
+        for star in range(1, 6):
+            fields[f'rating_{star}_count'] = sum(1 for r in ratings if min(5, max(1, math.ceil(r))) == star)
+        Provider.objects.filter(pk=provider.pk).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_service_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provider',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_average',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
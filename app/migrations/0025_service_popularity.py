@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of the values in app/popularity.py
+HALF_LIFE_DAYS = 30
+BOOKING_WEIGHTS = {'pending': 1.0, 'in_progress': 2.0, 'completed': 4.0, 'cancelled': 0.0}
+REVIEW_WEIGHT = 1.0
+
+
+def backfill_popularity(apps, schema_editor):
+    Service = apps.get_model('app', 'Service')
+    Booking = apps.get_model('app', 'Booking')
+    Review = apps.get_model('app', 'Review')
+    now = timezone.now()
+
+    def decay(timestamp):
+        return 0.5 ** (max((now - timestamp).total_seconds(), 0) / 86400 / HALF_LIFE_DAYS)
+
+    scores = defaultdict(float)
+    for booking in Booking.objects.all():
+        timestamp = booking.completed_at or booking.accepted_at or booking.created_at
+        scores[booking.service_id] += BOOKING_WEIGHTS.get(booking.status, 0) * decay(timestamp)
+
+    provider_scores = defaultdict(float)
+    for review in Review.objects.all():
+        provider_scores[review.provider_id] += REVIEW_WEIGHT * float(review.rating) / 5 * decay(review.created_at)
+
+    for service in Service.objects.all():
+        service.popularity = scores[service.pk] + provider_scores[service.provider_id]
+        service.save(update_fields=['popularity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_provider_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def create_site_statistics(apps, schema_editor):
+    SiteStatistics = apps.get_model('app', 'SiteStatistics')
+    User = apps.get_model('auth', 'User')
+    Provider = apps.get_model('app', 'Provider')
+    Service = apps.get_model('app', 'Service')
+    Review = apps.get_model('app', 'Review')
+    Booking = apps.get_model('app', 'Booking')
+
+    completed = Booking.objects.filter(status='completed')
+    SiteStatistics.objects.update_or_create(pk=1, defaults={
+        'total_users': User.objects.count(),
+        'total_providers': Provider.objects.count(),
+        'total_services': Service.objects.count(),
+        'total_reviews': Review.objects.count(),
+        'completed_bookings': completed.count(),
+        'total_revenue': completed.aggregate(total=Sum('service__price'))['total'] or 0,
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_service_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.IntegerField(default=0)),
+                ('total_providers', models.IntegerField(default=0)),
+                ('total_services', models.IntegerField(default=0)),
+                ('total_reviews', models.IntegerField(default=0)),
+                ('completed_bookings', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'verbose_name_plural': 'site statistics',
+            },
+        ),
+        migrations.RunPython(create_site_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_site_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('provider_sales', 'Providers by completed bookings'), ('provider_bookings', 'Providers by bookings'), ('category_sales', 'Categories by bookings')], max_length=20)),
+                ('window', models.CharField(choices=[('all', 'All time'), ('30d', 'Last 30 days'), ('7d', 'Last 7 days')], max_length=3)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.category')),
+                ('provider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.provider')),
+            ],
+            options={
+                'ordering': ['board', 'window', 'rank'],
+                'indexes': [models.Index(fields=['board', 'window', 'rank'], name='app_leaderb_board_2e5d3f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_leaderboard_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=12)),
+                ('count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='app.category')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='app.provider')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['provider', 'date'], name='app_booking_provide_5ca59a_idx'), models.Index(fields=['category', 'date'], name='app_booking_categor_f5fd71_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'provider', 'category', 'status'), name='unique_booking_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    Profile = apps.get_model('app', 'Profile')
+    Notification = apps.get_model('app', 'Notification')
+    unread = (
+        Notification.objects.filter(recipient=OuterRef('pk'), read=False)
+        .order_by().values('recipient').annotate(total=Count('id')).values('total')
+    )
+    Profile.objects.update(unread_notifications_count=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_booking_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, Greatest, Least
+
+
+def backfill_conversations(apps, schema_editor):
+    # Same format as Message.conversation_key(), in a single UPDATE
+    Message = apps.get_model('app', 'Message')
+    Message.objects.update(conversation=Concat(
+        Cast(Least('sender_id', 'recipient_id'), CharField()),
+        Value(':'),
+        Cast(Greatest('sender_id', 'recipient_id'), CharField()),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0032_message_unread_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.CharField(default='', editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp'], name='app_message_convers_384507_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Existing balances enter the ledger as one opening entry per profile
+    Profile = apps.get_model('app', 'Profile')
+    WalletTransaction = apps.get_model('app', 'WalletTransaction')
+    WalletTransaction.objects.bulk_create([
+        WalletTransaction(profile_id=profile_id, kind='opening_balance', amount=wallet)
+        for profile_id, wallet in Profile.objects.exclude(wallet=0).values_list('id', 'wallet')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0033_message_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_transaction_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_snapshots', to='app.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', '-last_transaction_id'], name='app_wallets_profile_0f46d0_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening_balance', 'Opening balance'), ('deposit', 'Deposit'), ('booking_payment', 'Booking payment'), ('booking_payout', 'Booking payout')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='wallet_transactions', to='app.booking')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_transactions', to='app.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'id'], name='app_wallett_profile_5688fe_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0034_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wallettransaction',
+            name='kind',
+            field=models.CharField(choices=[('opening_balance', 'Opening balance'), ('deposit', 'Deposit'), ('booking_payment', 'Booking payment'), ('booking_payout', 'Booking payout'), ('refund', 'Refund')], max_length=20),
+        ),
+    ]
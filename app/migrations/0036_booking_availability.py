@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, F, OuterRef, Subquery
+
+
+def backfill_ends_at(apps, schema_editor):
+    # Same as Booking.save(), in a single UPDATE
+    Booking = apps.get_model('app', 'Booking')
+    Service = apps.get_model('app', 'Service')
+    duration = Service.objects.filter(pk=OuterRef('service_id')).values('duration')[:1]
+    Booking.objects.update(ends_at=ExpressionWrapper(
+        F('scheduled_time') + Subquery(duration), output_field=DateTimeField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0035_wallet_refunds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('opens', models.TimeField()),
+                ('closes', models.TimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'working hours',
+                'ordering': ['weekday', 'opens'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_ends_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'in_progress'])), fields=['service', 'ends_at', 'scheduled_time'], name='booking_blocking_interval_idx'),
+        ),
+        migrations.AddField(
+            model_name='workinghours',
+            name='provider',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='app.provider'),
+        ),
+        migrations.AddIndex(
+            model_name='workinghours',
+            index=models.Index(fields=['provider', 'weekday'], name='app_working_provide_6e4b8a_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# Adding Service.popularity in 0025 made SQLite rebuild app_service, which
+# dropped the triggers 0023 created to keep the search index in sync. These
+# are frozen copies of them.
+FTS_TABLE = 'app_service_fts'
+
+TRIGGER_STATEMENTS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_ai AFTER INSERT ON app_service BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_ad AFTER DELETE ON app_service BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_service_fts_au AFTER UPDATE OF title, description ON app_service BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title, description = new.description WHERE rowid = old.id;
+    END
+    """,
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    for statement in TRIGGER_STATEMENTS:
+        schema_editor.execute(statement)
+    # Services added or edited while the triggers were missing aren't indexed right
+    schema_editor.execute(f"DELETE FROM {FTS_TABLE}")
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, description) SELECT id, title, description FROM app_service")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0036_booking_availability'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -5,14 +5,40 @@ from django.contrib.auth.models import User
 from decimal import Decimal
 
 from django.db.models import Count
+from django.utils import timezone
 
 
-class Profile(models.Model):
+class IncrementedFieldsMixin:
+    """
+    For models with columns that are only ever changed by UPDATE ... SET
+    column = column + x (see app/wallet.py, app/notifications.py,
+    app/ratings.py, app/popularity.py). Saving an existing row leaves
+    `incremented_fields` out unless update_fields names them, so writing
+    back an instance loaded earlier can't undo changes made in the meantime.
+    """
+    incremented_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.incremented_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Profile(IncrementedFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     phone = models.CharField(max_length=15, blank=True)
     location = models.CharField(max_length=100, blank=True)
     wallet = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    # Kept in step with Notification.read by signals, see app/notifications.py
+    unread_notifications_count = models.IntegerField(default=0)
+
+    # Only changed through the ledger (app/wallet.py) and the notification
+    # signals (app/notifications.py)
+    incremented_fields = ('wallet', 'unread_notifications_count')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -27,7 +53,7 @@ class Profile(models.Model):
         return hasattr(self, 'provider')
 
 
-class Provider(models.Model):
+class Provider(IncrementedFieldsMixin, models.Model):
     profile = models.OneToOneField(Profile, on_delete=models.CASCADE)
     about = models.TextField(blank=True, null=True)
     linkedin = models.URLField(blank=True, null=True)
@@ -35,6 +61,21 @@ class Provider(models.Model):
     facebook = models.URLField(blank=True, null=True)
     contact_email = models.EmailField(blank=True, null=True)
 
+    # Rating aggregates, kept up to date by the Review signals (see app/ratings.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=10, decimal_places=1, default=0)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0, db_index=True)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    incremented_fields = (
+        'rating_count', 'rating_sum', 'rating_average',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -43,48 +84,127 @@ class Provider(models.Model):
 
 
     # Statistics functions
+    def stats(self):
+        """Returns this provider's ProviderStats, computed with a single query and cached on the instance."""
+        if not hasattr(self, '_stats'):
+            self._stats = ProviderStats.for_provider(self)
+        return self._stats
+
     def total_services(self):
         """Returns the total number of services offered by the provider."""
-        return self.services.count()
+        return self.stats().total_services
 
     def total_reviews(self):
-        return self.reviews.count()
+        return self.rating_count
 
     def average_rating(self):
-        if self.reviews.exists():
-            return self.reviews.aggregate(models.Avg('rating'))['rating__avg']
+        if self.rating_count:
+            return self.rating_average
         return None
 
+    def rating_histogram(self):
+        """Returns the number of reviews per star (1 to 5), half stars rounded up."""
+        return {star: getattr(self, f'rating_{star}_count') for star in range(5, 0, -1)}
+
     def total_bookings(self):
         """Returns the total number of bookings for all services."""
-        return Booking.objects.filter(service__provider=self).count()
+        return self.stats().total_bookings
 
     def bookings_by_status(self):
         """Returns a dictionary of bookings grouped by status."""
-        statuses = Booking.objects.filter(service__provider=self).values('status').annotate(count=Count('id'))
-        return {status['status']: status['count'] for status in statuses}
+        return self.stats().bookings_by_status()
 
     def completed_bookings_percentage(self):
         """Calculates the percentage of completed bookings."""
-        total = self.total_bookings()
-        completed = Booking.objects.filter(service__provider=self, status='completed').count()
-        return (completed / total * 100) if total > 0 else 0.0
+        return self.stats().completed_bookings_percentage()
 
     def pending_bookings(self):
         """Returns the total number of pending bookings."""
-        return Booking.objects.filter(service__provider=self, status='pending').count()
+        return self.stats().pending
 
     def cancelled_bookings(self):
         """Returns the total number of cancelled bookings."""
-        return Booking.objects.filter(service__provider=self, status='cancelled').count()
+        return self.stats().cancelled
 
     def in_progress_bookings(self):
         """Returns the total number of in progress bookings."""
-        return Booking.objects.filter(service__provider=self, status='in_progress').count()
+        return self.stats().in_progress
 
     def completed_bookings(self):
         """Returns the total number of completed bookings."""
-        return Booking.objects.filter(service__provider=self, status='completed').count()
+        return self.stats().completed
+
+
+class ProviderStats:
+    """
+    Booking and service counters of one provider. Built with conditional
+    aggregation, so any number of providers costs one query (see for_providers).
+    """
+    STATUSES = ('pending', 'in_progress', 'completed', 'cancelled')
+
+    def __init__(self, provider_id, total_services=0, total_bookings=0,
+                 pending=0, in_progress=0, completed=0, cancelled=0):
+        self.provider_id = provider_id
+        self.total_services = total_services
+        self.total_bookings = total_bookings
+        self.pending = pending
+        self.in_progress = in_progress
+        self.completed = completed
+        self.cancelled = cancelled
+
+    def __repr__(self):
+        return f"<ProviderStats provider={self.provider_id} bookings={self.total_bookings}>"
+
+    def bookings_by_status(self):
+        """Same shape as a GROUP BY on status: statuses without bookings are left out."""
+        counts = {status: getattr(self, status) for status in self.STATUSES}
+        return {status: count for status, count in counts.items() if count}
+
+    def completed_bookings_percentage(self):
+        return (self.completed / self.total_bookings * 100) if self.total_bookings > 0 else 0.0
+
+    # Prefix of the annotations added to Provider querysets, so they don't shadow Provider methods
+    ANNOTATION_PREFIX = 'stats_'
+
+    @staticmethod
+    def aggregates(prefix=''):
+        """Annotations that compute every counter on a Provider queryset."""
+        return {
+            f'{prefix}total_services': Count('services', distinct=True),
+            f'{prefix}total_bookings': Count('services__booking'),
+            **{
+                f'{prefix}{status}': Count('services__booking', filter=models.Q(services__booking__status=status))
+                for status in ProviderStats.STATUSES
+            },
+        }
+
+    @classmethod
+    def annotate(cls, providers):
+        """Annotates a Provider queryset so from_annotated() can build each provider's stats without queries."""
+        return providers.annotate(**cls.aggregates(cls.ANNOTATION_PREFIX))
+
+    @classmethod
+    def for_providers(cls, provider_ids):
+        """Returns {provider_id: ProviderStats} for all the given ids in one round trip."""
+        rows = (
+            Provider.objects.filter(pk__in=provider_ids)
+            .order_by()
+            .values('pk')
+            .annotate(**cls.aggregates())
+        )
+        stats = {row.pop('pk'): row for row in rows}
+        return {pk: cls(pk, **stats[pk]) for pk in provider_ids if pk in stats}
+
+    @classmethod
+    def from_annotated(cls, provider):
+        """Builds the stats of a provider loaded with the aggregates() annotations, and caches them on it."""
+        prefix = cls.ANNOTATION_PREFIX
+        provider._stats = cls(provider.pk, **{name: getattr(provider, prefix + name) for name in cls.aggregates()})
+        return provider._stats
+
+    @classmethod
+    def for_provider(cls, provider):
+        return cls.for_providers([provider.pk]).get(provider.pk) or cls(provider.pk)
 
 
 class Chat(models.Model):
@@ -109,10 +229,30 @@ class Message(models.Model):
     content = models.TextField(default='')
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Same for both directions between two profiles, see conversation_key()
+    conversation = models.CharField(max_length=41, editable=False)
+
+    class Meta:
+        indexes = [
+            # Only unread messages, for the chat list's counts and marking a chat read
+            models.Index(fields=['recipient', 'chat'], condition=models.Q(is_read=False), name='message_unread_idx'),
+            # A thread between two profiles is a range of this index
+            models.Index(fields=['conversation', 'timestamp']),
+        ]
 
     def __str__(self):
         return f"From {self.sender.user.username} to {self.recipient.user.username}"
 
+    @staticmethod
+    def conversation_key(profile_id, other_profile_id):
+        low, high = sorted((profile_id, other_profile_id))
+        return f"{low}:{high}"
+
+    def save(self, *args, **kwargs):
+        if not self.conversation:
+            self.conversation = self.conversation_key(self.sender_id, self.recipient_id)
+        super().save(*args, **kwargs)
+
 
 class Review(models.Model):
     provider = models.ForeignKey(Provider, related_name='reviews', on_delete=models.CASCADE)
@@ -124,6 +264,12 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']  # Default ordering by most recent
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember what is currently counted in the provider aggregates
+        self._counted_provider_id = self.__dict__.get('provider_id') if self.pk else None
+        self._counted_rating = self.__dict__.get('rating') if self.pk else None
+
     def clean(self):
         if not (0 <= self.rating <= 5.0):
             raise ValidationError("Rating must be between 0 and 5.0")
@@ -145,7 +291,7 @@ class Category(models.Model):
         return self.name
 
 
-class Service(models.Model):
+class Service(IncrementedFieldsMixin, models.Model):
     provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='services')
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     title = models.CharField(max_length=80)
@@ -156,6 +302,10 @@ class Service(models.Model):
     approval = models.CharField(choices=[('pending approval', 'Pending Approval'), ('approved', 'Approved'), ('not approved', 'Not Approved')],max_length=16, default='pending approval')
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     image = models.ImageField(upload_to='service_images/', blank=True, null=True)
+    # Time-decayed score from bookings and reviews, see app/popularity.py
+    popularity = models.FloatField(default=0, db_index=True)
+
+    incremented_fields = ('popularity',)
 
     def __str__(self):
         return self.title
@@ -182,14 +332,71 @@ class Booking(models.Model):
     accepted_at = models.DateTimeField(blank=True, null=True)
     completed_at = models.DateTimeField(blank=True, null=True)
     cancelled_at = models.DateTimeField(blank=True, null=True)
+    # scheduled_time + the service's duration when booked, see app/availability.py
+    ends_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    # Bookings in these statuses take up the provider's time
+    BLOCKING_STATUSES = ('pending', 'in_progress')
+
+    class Meta:
+        indexes = [
+            # Bookings of a service in a given status that end after a given
+            # time are a range of this index; it also covers scheduled_time,
+            # so busy intervals are read from the index alone
+            models.Index(
+                fields=['service', 'status', 'ends_at', 'scheduled_time'],
+                name='booking_interval_idx',
+            ),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Status as last stored, so signals can tell which transition happened
+        self._saved_status = self.__dict__.get('status') if self.pk else None
+        self._saved_scheduled_time = self.__dict__.get('scheduled_time') if self.pk else None
 
     def __str__(self):
         return f"{self.service.title} - {self.customer.user.username} - {self.status}"
 
     def save(self, *args, **kwargs):
+        if self.ends_at is None or self.scheduled_time != self._saved_scheduled_time:
+            self.ends_at = self.scheduled_time + self.service.duration
         super().save(*args, **kwargs)
-        if self.status == 'in_progress' and not hasattr(self, 'chat'):
-            Chat.objects.create(booking=self)
+        self._saved_scheduled_time = self.scheduled_time
+
+
+class WorkingHours(models.Model):
+    """
+    A period of the week the provider takes bookings in. A day can have
+    several (e.g. around a lunch break); providers without any use
+    availability.DEFAULT_WORKING_HOURS.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    opens = models.TimeField()
+    closes = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'opens']
+        indexes = [models.Index(fields=['provider', 'weekday'])]
+        verbose_name_plural = 'working hours'
+
+    def clean(self):
+        if self.opens is not None and self.closes is not None and self.opens >= self.closes:
+            raise ValidationError("Closing time must be after opening time.")
+
+    def __str__(self):
+        return f"{self.provider.profile.user.username} {self.get_weekday_display()} {self.opens:%H:%M}-{self.closes:%H:%M}"
 
 
 class Notification(models.Model):
@@ -200,6 +407,157 @@ class Notification(models.Model):
     read = models.BooleanField(default=False)
     action_required = models.BooleanField(default=False)
     url = models.URLField(blank=True, null=True)
+    # Unread notifications with the same collapse key are merged into one row,
+    # see app.notifications.notify
+    collapse_key = models.CharField(max_length=100, blank=True, null=True)
+    count = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'collapse_key'],
+                condition=models.Q(read=False, collapse_key__isnull=False),
+                name='unique_unread_notification_group',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['recipient', 'read', '-updated_at', '-id']),
+            # Used by the retention job to find old read notifications
+            models.Index(fields=['updated_at'], condition=models.Q(read=True), name='notification_read_updated_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Whether the recipient's unread counter currently counts this notification
+        self._counted_unread = (self.__dict__.get('read') is False) if self.pk else False
 
     def __str__(self):
         return f"Notification for {self.recipient.user.username} - {'Read' if self.read else 'Unread'}"
+
+
+
+class SiteStatistics(models.Model):
+    """
+    Single row of platform-wide counters shown on the home page. Kept up to date
+    by signals (see app/site_stats.py) and fixed by `manage.py reconcile_site_statistics`.
+    """
+    total_users = models.IntegerField(default=0)
+    total_providers = models.IntegerField(default=0)
+    total_services = models.IntegerField(default=0)
+    total_reviews = models.IntegerField(default=0)
+    completed_bookings = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "site statistics"
+
+    def __str__(self):
+        return "Site statistics"
+
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One ranked row of a leaderboard snapshot. Snapshots are rebuilt in the
+    background by app/leaderboards.py so views never aggregate bookings.
+    """
+    BOARD_CHOICES = [
+        ('provider_sales', 'Providers by completed bookings'),
+        ('provider_bookings', 'Providers by bookings'),
+        ('category_sales', 'Categories by bookings'),
+    ]
+    WINDOW_CHOICES = [
+        ('all', 'All time'),
+        ('30d', 'Last 30 days'),
+        ('7d', 'Last 7 days'),
+    ]
+
+    board = models.CharField(max_length=20, choices=BOARD_CHOICES)
+    window = models.CharField(max_length=3, choices=WINDOW_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    total = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['board', 'window', 'rank']
+        indexes = [models.Index(fields=['board', 'window', 'rank'])]
+
+    def __str__(self):
+        return f"{self.board} ({self.window}) #{self.rank}"
+
+
+
+class BookingDailyRollup(models.Model):
+    """
+    Number of bookings (and their value) that reached `status` on `date`, per
+    provider and category. Fed by the Booking signals, rebuilt by
+    `manage.py backfill_booking_rollups`. See app/rollups.py.
+    """
+    date = models.DateField()
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='daily_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_rollups')
+    status = models.CharField(max_length=12, choices=Booking.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'provider', 'category', 'status'], name='unique_booking_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['provider', 'date']),
+            models.Index(fields=['category', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.provider_id}/{self.category_id} {self.status}: {self.count}"
+
+
+
+class WalletTransaction(models.Model):
+    """
+    Append-only ledger of every change to Profile.wallet. Rows are written
+    in the same transaction as the balance update, see app/wallet.py.
+    """
+    KIND_CHOICES = [
+        ('opening_balance', 'Opening balance'),
+        ('deposit', 'Deposit'),
+        ('booking_payment', 'Booking payment'),
+        ('booking_payout', 'Booking payout'),
+        ('refund', 'Refund'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='wallet_transactions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Positive for money in, negative for money out
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='wallet_transactions')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['profile', 'id'])]
+
+    def __str__(self):
+        return f"{self.profile.user.username} {self.kind} {self.amount}"
+
+
+
+class WalletSnapshot(models.Model):
+    """
+    A profile's balance as of ledger entry `last_transaction_id`, taken by
+    `manage.py snapshot_wallets`. The balance at any later point is the
+    snapshot plus the transactions after it.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='wallet_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_transaction_id = models.BigIntegerField()
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['profile', '-last_transaction_id'])]
+
+    def __str__(self):
+        return f"{self.profile.user.username}: {self.balance} at #{self.last_transaction_id}"
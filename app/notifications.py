@@ -0,0 +1,234 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import pubsub
+from .batching import BatchWriter
+from .models import Notification, Profile
+
+logger = logging.getLogger(__name__)
+
+# Notifications sent with dispatch() are written by a background worker in
+# batches (see app/batching.py), so views don't pay for the inserts
+BATCH_SIZE = 200
+
+# Days a read notification is kept, by type. The type is the prefix of the
+# collapse key ('chat:12' is a 'chat' notification); everything else is 'other'.
+RETENTION_DAYS = {
+    'chat': 30,
+    'service-bookings': 90,
+    'reviews': 180,
+    'other': 90,
+}
+# Rows deleted per transaction, so the job never holds SQLite's write lock for long
+PURGE_BATCH_SIZE = 500
+
+def _add_to_group(recipient, collapse_key, count=1, **fields):
+    """Folds `count` more events into the recipient's unread group, if there is one."""
+    return Notification.objects.filter(recipient=recipient, collapse_key=collapse_key, read=False).update(
+        count=F('count') + count, updated_at=timezone.now(), **fields
+    )
+
+
+def notify(recipient, message, url=None, booking=None, action_required=False, collapse_key=None, count=1):
+    """
+    Writes a notification for `recipient` (a Profile or its id) right away.
+    Views should use dispatch() instead.
+
+    Notifications with a `collapse_key` (e.g. one per chat) are coalesced: while
+    the recipient has an unread one with the same key, that row takes the new
+    message and its count goes up instead of a new row being inserted, so the
+    unread counter still counts it once.
+    """
+    recipient_id = getattr(recipient, 'pk', recipient)
+    _write(recipient_id, message, url, getattr(booking, 'pk', booking), action_required, collapse_key, count)
+    transaction.on_commit(lambda: publish_unread_counts({recipient_id: {'message': message, 'url': url}}))
+
+
+def _write(recipient_id, message, url, booking_id, action_required, collapse_key, count):
+    fields = {'message': message, 'url': url, 'booking_id': booking_id, 'action_required': action_required}
+    if collapse_key:
+        if _add_to_group(recipient_id, collapse_key, count, **fields):
+            return
+        try:
+            with transaction.atomic():
+                Notification.objects.create(recipient_id=recipient_id, collapse_key=collapse_key, count=count, **fields)
+            return
+        except IntegrityError:
+            # A concurrent request opened the group first
+            if _add_to_group(recipient_id, collapse_key, count, **fields):
+                return
+    Notification.objects.create(recipient_id=recipient_id, collapse_key=collapse_key, count=count, **fields)
+
+
+def dispatch(recipients, message, url=None, booking=None, action_required=False, collapse_key=None):
+    """
+    Queues a notification for one recipient or a list of them (Profiles or
+    ids). Nothing is queued until the current transaction commits, and the
+    background worker writes it shortly after.
+    """
+    if not isinstance(recipients, (list, tuple, set)):
+        recipients = [recipients]
+    events = [
+        {
+            'recipient_id': getattr(recipient, 'pk', recipient),
+            'message': message,
+            'url': url,
+            'booking_id': getattr(booking, 'pk', booking),
+            'action_required': action_required,
+            'collapse_key': collapse_key,
+        }
+        for recipient in recipients
+    ]
+    transaction.on_commit(lambda: _writer.put(events))
+
+
+def flush(timeout=None):
+    """Blocks until every dispatched notification has been written. Returns False on timeout."""
+    return _writer.flush(timeout)
+
+
+def write_batch(events):
+    """
+    Writes a batch of queued events. Events sharing a recipient and collapse
+    key are merged first; each merged group then costs one UPDATE if an unread
+    group already exists, and all new rows go in with a single bulk_create.
+    """
+    groups = {}
+    rows = []
+    for event in events:
+        if not event['collapse_key']:
+            rows.append({**event, 'count': 1})
+            continue
+        key = (event['recipient_id'], event['collapse_key'])
+        count = groups[key]['count'] + 1 if key in groups else 1
+        # The latest event's message and link win
+        groups[key] = {**event, 'count': count}
+
+    for (recipient_id, collapse_key), group in groups.items():
+        fields = {name: group[name] for name in ('message', 'url', 'booking_id', 'action_required')}
+        if not _add_to_group(recipient_id, collapse_key, group['count'], **fields):
+            rows.append(group)
+
+    if rows:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                # bulk_create skips the post_save signals, so the counters are bumped here
+                Notification.objects.bulk_create([Notification(updated_at=now, **row) for row in rows])
+                _bump_unread_counts(row['recipient_id'] for row in rows)
+        except IntegrityError:
+            # Another process opened one of the groups meanwhile, fall back to one at a time
+            for row in rows:
+                _write(row['recipient_id'], row['message'], row['url'], row['booking_id'],
+                       row['action_required'], row['collapse_key'], row['count'])
+
+    # Events are in order, so this keeps each recipient's latest one
+    latest = {event['recipient_id']: {'message': event['message'], 'url': event['url']} for event in events}
+    publish_unread_counts(latest)
+
+
+_writer = BatchWriter('notification-dispatch', write_batch, batch_size=BATCH_SIZE)
+
+
+def _bump_unread_counts(recipient_ids):
+    added = defaultdict(int)
+    for recipient_id in recipient_ids:
+        added[recipient_id] += 1
+    # One UPDATE per distinct increment rather than one per recipient
+    by_delta = defaultdict(list)
+    for recipient_id, delta in added.items():
+        by_delta[delta].append(recipient_id)
+    for delta, recipient_ids in by_delta.items():
+        Profile.objects.filter(pk__in=recipient_ids).update(
+            unread_notifications_count=F('unread_notifications_count') + delta
+        )
+
+
+def adjust_unread_count(profile_id, delta):
+    Profile.objects.filter(pk=profile_id).update(
+        unread_notifications_count=F('unread_notifications_count') + delta
+    )
+    transaction.on_commit(lambda: publish_unread_counts({profile_id: None}))
+
+
+def notification_channel(profile_id):
+    return f'notifications:{profile_id}'
+
+
+def publish_unread_counts(recipients):
+    """
+    Pushes the current unread counters to the recipients' live streams, along
+    with the notification that changed them when there is one.
+    `recipients` maps profile ids to {'message': ..., 'url': ...} or None.
+    """
+    counts = Profile.objects.filter(pk__in=recipients).values_list('pk', 'unread_notifications_count')
+    try:
+        for profile_id, unread in counts:
+            data = {'unread': unread, 'notification': recipients[profile_id]}
+            pubsub.publish(notification_channel(profile_id), {'event': 'notifications', 'data': data})
+    except Exception:
+        # Live updates are best effort, the notifications themselves are already saved
+        logger.exception("Failed to publish notification updates")
+
+
+def reconcile_unread_counts(profiles=None):
+    """
+    Recomputes the unread counters from the notifications table with a single
+    UPDATE, for all profiles or the given queryset. Returns the number of rows updated.
+    """
+    if profiles is None:
+        profiles = Profile.objects.all()
+    unread = (
+        Notification.objects.filter(recipient=OuterRef('pk'), read=False)
+        .order_by().values('recipient').annotate(total=Count('id')).values('total')
+    )
+    return profiles.update(unread_notifications_count=Coalesce(Subquery(unread), Value(0)))
+
+
+def _type_filter(notification_type, types):
+    if notification_type != 'other':
+        return Q(collapse_key__startswith=f'{notification_type}:')
+    known = Q()
+    for other_type in types:
+        if other_type != 'other':
+            known |= Q(collapse_key__startswith=f'{other_type}:')
+    return ~known
+
+
+def purge_read_notifications(retention=None, batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Deletes read notifications older than their type's retention (see
+    RETENTION_DAYS, overridden per type by `retention`), `batch_size` rows per
+    transaction, sleeping `pause` seconds between batches. Unread ones are never
+    touched, so the unread counters are unaffected. Returns the number of rows
+    deleted per type.
+    """
+    retention = {**RETENTION_DAYS, **(retention or {})}
+    now = timezone.now()
+    deleted = {}
+    for notification_type, days in retention.items():
+        expired = Notification.objects.filter(
+            _type_filter(notification_type, retention),
+            read=True,
+            updated_at__lt=now - timedelta(days=days),
+        )
+        deleted[notification_type] = 0
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                count, _ = Notification.objects.filter(pk__in=ids, read=True).delete()
+            deleted[notification_type] += count
+            if len(ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return deleted
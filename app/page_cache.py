@@ -0,0 +1,107 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# Pages rendered for anonymous visitors are shared by all of them. Every
+# entry key embeds the current version, so bumping the version (done by the
+# signals on Service, Booking, Review, ...) drops all cached pages at once.
+# The version and the single-flight lock only coordinate the workers that
+# share the cache, hence the shared CACHES backend in settings.py.
+VERSION_KEY = 'page_cache:version'
+PAGE_TIMEOUT = 5 * 60
+
+# Single-flight: on a miss only the request holding the lock renders the
+# page, the others wait up to LOCK_WAIT seconds for it to show up.
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    # Time based so a version is never reused, even if the key was evicted
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _page_key(request, view_name):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page_cache:{current_version()}:{view_name}:{path}'
+
+
+def _is_cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        # Flash messages are meant for one visitor only
+        and not get_messages(request)
+    )
+
+
+def _is_shareable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A rendered CSRF token belongs to one visitor
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _to_response(entry):
+    content, status, content_type = entry
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def anonymous_page_cache(view):
+    """Caches the full response of `view` for anonymous visitors, keyed by path and query string."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _is_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = _page_key(request, view.__name__)
+        entry = cache.get(key)
+        if entry is not None:
+            return _to_response(entry)
+
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, True, LOCK_TIMEOUT)
+        if not locked:
+            entry = _wait_for(key)
+            if entry is not None:
+                return _to_response(entry)
+            # The other render is taking too long, render it ourselves
+
+        try:
+            response = view(request, *args, **kwargs)
+            if _is_shareable(request, response):
+                cache.set(key, (response.content, response.status_code, response['Content-Type']), PAGE_TIMEOUT)
+            return response
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,262 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import F, Q, Window
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import RowNumber
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPage:
+    """
+    One page of a keyset (cursor) paginated queryset.
+
+    `next_cursor` / `previous_cursor` are opaque strings meant to be passed back
+    as the `after` / `before` URL parameters, or None when there is no such page.
+    """
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def page_query(request, *cursor_params):
+    """Returns the current query string without the cursor parameters, for building page links."""
+    params = request.GET.copy()
+    for name in cursor_params or ('after', 'before'):
+        params.pop(name, None)
+    return params.urlencode()
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parse_datetime(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_dump_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decodes a cursor into a list of `size` values. Returns None if the cursor is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    try:
+        return [_load_value(value) for value in values]
+    except (ValueError, ArithmeticError):
+        return None
+
+
+def _field_name(order):
+    return order.lstrip('-')
+
+
+def _seek_filter(ordering, values, forward=True):
+    """
+    Builds the WHERE clause that selects the rows strictly after (or before)
+    the row whose ordering values are `values`:
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+    """
+    condition = Q()
+    equal = Q()
+    for order, value in zip(ordering, values):
+        name = _field_name(order)
+        descending = order.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _reverse(ordering):
+    return [order[1:] if order.startswith('-') else f'-{order}' for order in ordering]
+
+
+def _ordering_field(queryset, name):
+    """The model field or annotation output field `name` orders by, or None if it can't be told."""
+    try:
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        model = queryset.model
+        *relations, last = name.split(LOOKUP_SEP)
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.pk if last == 'pk' else model._meta.get_field(last)
+    except (FieldDoesNotExist, FieldError, AttributeError):
+        return None
+
+
+def _to_field_types(queryset, names, values):
+    """
+    Converts decoded cursor values to the types of the columns they are
+    compared with. Returns None if any of them doesn't fit (e.g. a hand-edited
+    cursor), so the ORM never sees it.
+    """
+    converted = []
+    for name, value in zip(names, values):
+        if value is None:
+            return None
+        field = _ordering_field(queryset, name)
+        if field is not None:
+            try:
+                value = field.to_python(value)
+            except (ValidationError, ValueError, TypeError, ArithmeticError):
+                return None
+        converted.append(value)
+    return converted
+
+
+def _read_cursors(queryset, ordering, after, before):
+    """
+    Returns (cursor values or None, whether paging forward) for the `after` /
+    `before` parameters. A cursor that can't be read counts as no cursor.
+    """
+    names = [_field_name(order) for order in ordering]
+
+    def read(cursor):
+        values = decode_cursor(cursor, len(ordering))
+        return _to_field_types(queryset, names, values) if values is not None else None
+
+    cursor_values = None
+    forward = True
+    if before:
+        cursor_values = read(before)
+        forward = cursor_values is None
+    if after and forward:
+        cursor_values = read(after)
+    return cursor_values, forward
+
+
+def _build_page(items, names, cursor_values, forward, page_size):
+    """
+    Turns up to `page_size` + 1 rows, in display order, into a KeysetPage.
+    The extra row only tells whether there is a page beyond this one: it is
+    the last row when paging forward, the first when paging backwards.
+    """
+    has_more = len(items) > page_size
+    items = items[:page_size] if forward else items[-page_size:]
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, name) for name in names])
+
+    next_cursor = previous_cursor = None
+    if items:
+        if forward:
+            next_cursor = cursor_for(items[-1]) if has_more else None
+            previous_cursor = cursor_for(items[0]) if cursor_values is not None else None
+        else:
+            # Paging backwards always comes from a later page
+            next_cursor = cursor_for(items[-1])
+            previous_cursor = cursor_for(items[0]) if has_more else None
+
+    return KeysetPage(items, next_cursor, previous_cursor)
+
+
+def keyset_paginate(queryset, ordering, after=None, before=None, page_size=24):
+    """
+    Paginates `queryset` by `ordering` without OFFSET, so every page costs the
+    same regardless of how deep the user has scrolled.
+
+    The last entry of `ordering` must be unique (normally the primary key) so
+    that cursors are stable. Ordering columns must not be NULL; wrap nullable
+    annotations in Coalesce first.
+    """
+    ordering = list(ordering)
+    cursor_values, forward = _read_cursors(queryset, ordering, after, before)
+
+    if cursor_values is not None:
+        queryset = queryset.filter(_seek_filter(ordering, cursor_values, forward))
+
+    queryset = queryset.order_by(*(ordering if forward else _reverse(ordering)))
+    items = list(queryset[:page_size + 1])
+    if not forward:
+        items.reverse()
+
+    return _build_page(items, [_field_name(order) for order in ordering], cursor_values, forward, page_size)
+
+
+def keyset_paginate_groups(queryset, field, cursors, ordering, page_size=24):
+    """
+    keyset_paginate() for each value of `field` separately, in a single query.
+    `cursors` maps every value of `field` to show to its (after, before)
+    cursors. Returns {value: KeysetPage}.
+
+    Each group's page is picked with ROW_NUMBER() over that group, counted
+    away from its cursor, so the query returns at most `page_size` + 1 rows
+    per group however many rows there are.
+    """
+    ordering = list(ordering)
+    states = {value: _read_cursors(queryset, ordering, after, before) for value, (after, before) in cursors.items()}
+
+    condition = Q()
+    for value, (cursor_values, forward) in states.items():
+        group = Q(**{field: value})
+        if cursor_values is not None:
+            group &= _seek_filter(ordering, cursor_values, forward)
+        condition |= group
+
+    def row_number(order):
+        return Window(RowNumber(), partition_by=F(field), order_by=list(order))
+
+    backward = [value for value, (cursor_values, forward) in states.items() if not forward]
+    queryset = queryset.filter(condition).annotate(
+        _position=row_number(ordering),
+        _position_backward=row_number(_reverse(ordering)),
+    )
+    if backward:
+        queryset = queryset.filter(
+            Q(**{f'{field}__in': backward}, _position_backward__lte=page_size + 1)
+            | (~Q(**{f'{field}__in': backward}) & Q(_position__lte=page_size + 1))
+        )
+    else:
+        queryset = queryset.filter(_position__lte=page_size + 1)
+
+    rows = {value: [] for value in cursors}
+    for item in queryset.order_by(field, *ordering):
+        rows[getattr(item, field)].append(item)
+
+    names = [_field_name(order) for order in ordering]
+    return {
+        value: _build_page(rows[value], names, cursor_values, forward, page_size)
+        for value, (cursor_values, forward) in states.items()
+    }
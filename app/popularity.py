@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Booking, Review, Service
+
+# A booking or review counts half as much after this many days
+HALF_LIFE_DAYS = 30
+
+# How much a booking adds to its service's popularity, by status
+BOOKING_WEIGHTS = {
+    'pending': 1.0,
+    'in_progress': 2.0,
+    'completed': 4.0,
+    'cancelled': 0.0,
+}
+
+# A 5 star review adds this much to every service of the reviewed provider
+REVIEW_WEIGHT = 1.0
+
+
+def decay(timestamp, now):
+    age_days = max((now - timestamp).total_seconds(), 0) / 86400
+    return 0.5 ** (age_days / HALF_LIFE_DAYS)
+
+
+def review_score(rating):
+    return REVIEW_WEIGHT * float(rating) / 5
+
+
+def record_booking_status(service_id, old_status, new_status):
+    """
+    Moves a service's popularity by the weight difference between two booking
+    statuses (old_status is None for new bookings). The change counts as fresh,
+    refresh_popularity() decays it later on.
+    """
+    delta = BOOKING_WEIGHTS.get(new_status, 0) - BOOKING_WEIGHTS.get(old_status, 0)
+    if delta:
+        Service.objects.filter(pk=service_id).update(popularity=F('popularity') + delta)
+
+
+def record_review(provider_id, rating, sign=1):
+    """Adds (or removes) a review's weight to every service of the provider."""
+    Service.objects.filter(provider_id=provider_id).update(
+        popularity=F('popularity') + sign * review_score(rating)
+    )
+
+
+def refresh_popularity(batch_size=500):
+    """
+    Recomputes every service's popularity from scratch, applying the time decay.
+    Meant to run periodically (see the refresh_popularity command). Returns the
+    number of services updated.
+    """
+    now = timezone.now()
+    scores = defaultdict(float)
+
+    bookings = Booking.objects.values_list(
+        'service_id', 'status', 'created_at', 'accepted_at', 'completed_at'
+    )
+    for service_id, status, created_at, accepted_at, completed_at in bookings.iterator():
+        # Decay from the moment the booking reached its current status
+        timestamp = completed_at or accepted_at or created_at
+        scores[service_id] += BOOKING_WEIGHTS.get(status, 0) * decay(timestamp, now)
+
+    provider_scores = defaultdict(float)
+    for provider_id, rating, created_at in Review.objects.values_list('provider_id', 'rating', 'created_at').iterator():
+        provider_scores[provider_id] += review_score(rating) * decay(created_at, now)
+
+    updated = 0
+    batch = []
+    for service in Service.objects.only('id', 'provider_id').iterator():
+        service.popularity = scores[service.pk] + provider_scores[service.provider_id]
+        batch.append(service)
+        if len(batch) >= batch_size:
+            updated += Service.objects.bulk_update(batch, ['popularity'])
+            batch = []
+    if batch:
+        updated += Service.objects.bulk_update(batch, ['popularity'])
+    return updated
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Publish/subscribe used to push live updates (see the notification stream).
+# publish() is synchronous and may be called from any thread, e.g. a view or
+# the notification worker; subscribe() is a coroutine awaited on the event
+# loop of the ASGI connection that is going to read the messages. Once it
+# returns, the subscription receives everything published to the channel.
+#
+# The backend is chosen with the PUBSUB_BACKEND setting. LocalBroker only
+# reaches clients connected to the same process; RedisBroker (needs the
+# `redis` package and REDIS_URL) lets several ASGI workers share channels.
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class LocalBroker:
+    """In-process broker: one asyncio queue per subscriber."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def subscribe(self, channel):
+        subscription = LocalSubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class LocalSubscription:
+    # Messages beyond this are dropped for a client that stopped reading
+    MAX_PENDING = 100
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.MAX_PENDING)
+
+    def deliver(self, message):
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if not self._queue.full():
+            self._queue.put_nowait(message)
+
+    async def start(self):
+        # Registered with the broker on creation already
+        pass
+
+    async def get(self, timeout=None):
+        """Waits for the next message. Returns None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker._unsubscribe(self)
+
+
+class RedisBroker:
+    """Broker on top of Redis pub/sub, shared by every process using the same REDIS_URL."""
+
+    def __init__(self):
+        import redis
+
+        self.url = getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        return RedisSubscription(self.url, channel)
+
+
+class RedisSubscription:
+    def __init__(self, url, channel):
+        import redis.asyncio
+
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self.channel = channel
+
+    async def start(self):
+        # Redis only delivers messages published after SUBSCRIBE has been sent
+        await self._pubsub.subscribe(self.channel)
+
+    async def get(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            message = await self._pubsub.get_message(timeout=remaining)
+            if message is not None:
+                return json.loads(message['data'])
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            backend = getattr(settings, 'PUBSUB_BACKEND', 'app.pubsub.LocalBroker')
+            _broker = import_string(backend)()
+        return _broker
+
+
+def publish(channel, message):
+    get_broker().publish(channel, message)
+
+
+async def subscribe(channel):
+    subscription = get_broker().subscribe(channel)
+    try:
+        await subscription.start()
+    except BaseException:
+        await subscription.close()
+        raise
+    return subscription
@@ -0,0 +1,84 @@
+import math
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, F, Value, DecimalField, FloatField, ExpressionWrapper, Count, Sum, Q
+from django.db.models.functions import Cast
+
+from .models import Provider, Review
+
+STARS = range(1, 6)
+
+
+def star_bucket(rating):
+    """Maps a rating (0 to 5, in half steps) to its histogram bucket, 1 to 5."""
+    return min(5, max(1, math.ceil(Decimal(rating))))
+
+
+def _refresh_average(provider_id):
+    Provider.objects.filter(pk=provider_id).update(
+        rating_average=Case(
+            # Cast so SQLite does not truncate with integer division
+            When(rating_count__gt=0, then=ExpressionWrapper(
+                Cast('rating_sum', FloatField()) / F('rating_count'), output_field=DecimalField()
+            )),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(),
+        )
+    )
+
+
+def apply_rating(provider_id, rating, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) one rating from a provider's aggregates.
+    The counters are changed with F() expressions, so concurrent reviews never
+    overwrite each other.
+    """
+    bucket = f'rating_{star_bucket(rating)}_count'
+    with transaction.atomic():
+        Provider.objects.filter(pk=provider_id).update(
+            rating_count=F('rating_count') + sign,
+            rating_sum=F('rating_sum') + sign * Decimal(rating),
+            **{bucket: F(bucket) + sign},
+        )
+        _refresh_average(provider_id)
+
+
+def rebuild_ratings(providers=None):
+    """
+    Recomputes the rating aggregates from the reviews table, for all providers
+    or just the given queryset. Returns the number of providers updated.
+    """
+    if providers is None:
+        providers = Provider.objects.all()
+
+    aggregates = {
+        'count': Count('id'),
+        'total': Sum('rating'),
+    }
+    for star in STARS:
+        # Same buckets as star_bucket(): half stars are rounded up
+        bucket = Q(rating__lte=star) if star == 1 else Q(rating__gt=star - 1, rating__lte=star)
+        aggregates[f'star_{star}'] = Count('id', filter=bucket)
+
+    rows = {
+        row['provider_id']: row
+        for row in Review.objects.filter(provider__in=providers)
+        .order_by().values('provider_id').annotate(**aggregates)
+    }
+
+    updated = 0
+    with transaction.atomic():
+        for provider in providers.only('pk'):
+            row = rows.get(provider.pk, {})
+            count = row.get('count', 0)
+            total = row.get('total') or Decimal('0')
+            fields = {
+                'rating_count': count,
+                'rating_sum': total,
+                'rating_average': (total / count) if count else Decimal('0'),
+            }
+            for star in STARS:
+                fields[f'rating_{star}_count'] = row.get(f'star_{star}', 0)
+            updated += Provider.objects.filter(pk=provider.pk).update(**fields)
+    return updated
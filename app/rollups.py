@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Booking, BookingDailyRollup, Service
+
+# Timestamp that tells when a booking reached each status
+STATUS_TIMESTAMPS = {
+    'pending': 'created_at',
+    'in_progress': 'accepted_at',
+    'completed': 'completed_at',
+    'cancelled': 'cancelled_at',
+}
+
+
+def _add(date, provider_id, category_id, status, count, revenue):
+    rollup = BookingDailyRollup.objects.filter(
+        date=date, provider_id=provider_id, category_id=category_id, status=status
+    )
+    if rollup.update(count=F('count') + count, revenue=F('revenue') + revenue):
+        return
+    try:
+        with transaction.atomic():
+            BookingDailyRollup.objects.create(
+                date=date, provider_id=provider_id, category_id=category_id,
+                status=status, count=count, revenue=revenue,
+            )
+    except IntegrityError:
+        # Another request created the row first
+        rollup.update(count=F('count') + count, revenue=F('revenue') + revenue)
+
+
+def record_booking_status(booking, status):
+    """Counts `booking` as having reached `status`, on the day of the matching timestamp."""
+    service = Service.objects.filter(pk=booking.service_id).values('provider_id', 'category_id', 'price').first()
+    if service is None:
+        return
+    timestamp = getattr(booking, STATUS_TIMESTAMPS.get(status, ''), None) or timezone.now()
+    _add(timezone.localdate(timestamp), service['provider_id'], service['category_id'],
+         status, 1, service['price'] or Decimal('0'))
+
+
+@transaction.atomic
+def backfill_rollups():
+    """Rebuilds the whole rollup table from the bookings. Returns the number of rows written."""
+    BookingDailyRollup.objects.all().delete()
+
+    rows = []
+    for status, field in STATUS_TIMESTAMPS.items():
+        if status == 'pending':
+            # Every booking starts out pending
+            reached = Q()
+        else:
+            # Older bookings may have reached the status without recording when
+            reached = Q(**{f'{field}__isnull': False}) | Q(status=status)
+        grouped = (
+            Booking.objects.filter(reached)
+            .annotate(day=TruncDate(Coalesce(field, 'accepted_at', 'created_at')))
+            .values('day', 'service__provider_id', 'service__category_id')
+            .annotate(count=Count('id'), revenue=Sum('service__price'))
+            .order_by()
+        )
+        rows += [
+            BookingDailyRollup(
+                date=row['day'], provider_id=row['service__provider_id'],
+                category_id=row['service__category_id'], status=status,
+                count=row['count'], revenue=row['revenue'] or 0,
+            )
+            for row in grouped
+        ]
+    BookingDailyRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def daily_series(since=None, until=None, by_status=False, **filters):
+    """
+    Per-day booking counts and revenue from the rollup table, e.g.
+    daily_series(provider=provider, status='completed', since=date). Returns
+    a list of {'date', 'count', 'revenue'} dicts ordered by date.
+
+    A booking has a row for every status it went through, so summing across
+    statuses counts it several times: filter on `status`, or pass
+    `by_status=True` to get one dict per date and status instead.
+    """
+    rollups = BookingDailyRollup.objects.filter(**filters)
+    if since:
+        rollups = rollups.filter(date__gte=since)
+    if until:
+        rollups = rollups.filter(date__lte=until)
+    group_by = ('date', 'status') if by_status else ('date',)
+    return list(
+        rollups.values(*group_by)
+        .annotate(count=Sum('count'), revenue=Sum('revenue'))
+        .order_by(*group_by)
+    )
@@ -0,0 +1,125 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+
+# Name of the SQLite FTS5 table that mirrors Service.title / Service.description.
+# It is created by migration 0023; the triggers that keep it in sync are
+# (re)created after every migrate by ensure_service_index_triggers(), since
+# SQLite drops them whenever a migration rebuilds app_service.
+SERVICE_FTS_TABLE = 'app_service_fts'
+
+SERVICE_FTS_TRIGGERS = {
+    'app_service_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS app_service_fts_ai AFTER INSERT ON app_service BEGIN
+            INSERT INTO {SERVICE_FTS_TABLE} (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """,
+    'app_service_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS app_service_fts_ad AFTER DELETE ON app_service BEGIN
+            DELETE FROM {SERVICE_FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+    'app_service_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS app_service_fts_au AFTER UPDATE OF title, description ON app_service BEGIN
+            UPDATE {SERVICE_FTS_TABLE} SET title = new.title, description = new.description WHERE rowid = old.id;
+        END
+    """,
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = None
+
+
+def _missing_triggers(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'app_service'")
+        return set(SERVICE_FTS_TRIGGERS) - {name for name, in cursor.fetchall()}
+
+
+def fts_available():
+    """
+    Returns True if the database has the FTS5 index for services, along with
+    the triggers that keep it up to date. Without them the index would go
+    stale, so search falls back to LIKE.
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and SERVICE_FTS_TABLE in connection.introspection.table_names()
+            and not _missing_triggers(connection)
+        )
+    return _fts_available
+
+
+def ensure_service_index_triggers(using=DEFAULT_DB_ALIAS):
+    """
+    Creates any missing sync trigger and re-indexes the services if one was
+    missing, as rows changed in the meantime weren't indexed. Runs after
+    every migrate (see signals.py).
+    """
+    global _fts_available
+    db = connections[using]
+    if db.vendor != 'sqlite' or SERVICE_FTS_TABLE not in db.introspection.table_names():
+        return
+    missing = _missing_triggers(db)
+    if missing:
+        with transaction.atomic(using=using), db.cursor() as cursor:
+            for name in missing:
+                cursor.execute(SERVICE_FTS_TRIGGERS[name])
+            _reindex(cursor)
+    _fts_available = None
+
+
+def build_match_query(search_query):
+    """
+    Turns free text typed by the user into a safe FTS5 MATCH expression.
+    Every word becomes a quoted prefix term, and all terms must match.
+    """
+    tokens = TOKEN_RE.findall(search_query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_services(queryset, search_query):
+    """
+    Filters a Service queryset by `search_query` and annotates each row with
+    `search_rank` (lower is better). The index ranks with bm25, weighing title
+    matches more than description matches.
+
+    Falls back to a LIKE scan when the FTS5 index is not available.
+    """
+    match_query = build_match_query(search_query)
+
+    if not match_query or not fts_available():
+        return queryset.filter(
+            Q(title__icontains=search_query) | Q(description__icontains=search_query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    return queryset.extra(
+        tables=[SERVICE_FTS_TABLE],
+        where=[
+            f'{SERVICE_FTS_TABLE}.rowid = app_service.id',
+            f'{SERVICE_FTS_TABLE} MATCH %s',
+        ],
+        params=[match_query],
+    ).annotate(search_rank=RawSQL(f'{SERVICE_FTS_TABLE}.rank', [], output_field=FloatField()))
+
+
+def _reindex(cursor):
+    cursor.execute(f'DELETE FROM {SERVICE_FTS_TABLE}')
+    cursor.execute(
+        f'INSERT INTO {SERVICE_FTS_TABLE} (rowid, title, description) '
+        f'SELECT id, title, description FROM app_service'
+    )
+    return cursor.rowcount
+
+
+def rebuild_service_index():
+    """Rebuilds the FTS5 index from the Service table. Returns the number of indexed rows."""
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        return _reindex(cursor)
@@ -1,3 +1,130 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
-from .models import Booking, Chat
\ No newline at end of file
+from . import bookings, notifications, page_cache, popularity, ratings, search, site_stats
+from .facets import invalidate_category_facets
+from .models import Booking, Category, Chat, Notification, Provider, Review, Service
+
+
+@receiver(post_save, sender=Review)
+def update_provider_rating_on_save(sender, instance, created, **kwargs):
+    old_provider_id = instance._counted_provider_id
+    old_rating = instance._counted_rating
+
+    if created:
+        site_stats.bump(total_reviews=1)
+
+    if not created and old_rating is None:
+        # Loaded without its rating, so we don't know what was counted
+        ratings.rebuild_ratings(Provider.objects.filter(pk__in={old_provider_id, instance.provider_id} - {None}))
+    elif created or old_provider_id != instance.provider_id or old_rating != instance.rating:
+        if not created:
+            ratings.apply_rating(old_provider_id, old_rating, sign=-1)
+            popularity.record_review(old_provider_id, old_rating, sign=-1)
+        ratings.apply_rating(instance.provider_id, instance.rating)
+        popularity.record_review(instance.provider_id, instance.rating)
+
+    instance._counted_provider_id = instance.provider_id
+    instance._counted_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def update_provider_rating_on_delete(sender, instance, **kwargs):
+    site_stats.bump(total_reviews=-1)
+    if instance._counted_rating is not None:
+        ratings.apply_rating(instance._counted_provider_id, instance._counted_rating, sign=-1)
+        popularity.record_review(instance._counted_provider_id, instance._counted_rating, sign=-1)
+    else:
+        ratings.rebuild_ratings(Provider.objects.filter(pk=instance.provider_id))
+
+
+@receiver(post_save, sender=Booking)
+def track_booking_status(sender, instance, created, **kwargs):
+    # Status changes made through bookings.transition() don't save(), they record themselves
+    old_status = None if created else instance._saved_status
+    if old_status != instance.status:
+        bookings.record_status_change(instance, old_status, instance.status)
+    instance._saved_status = instance.status
+
+
+@receiver(post_delete, sender=Booking)
+def untrack_booking(sender, instance, **kwargs):
+    site_stats.record_booking_status(instance.service_id, instance._saved_status, None)
+
+
+@receiver(post_save, sender=Service)
+def count_new_service(sender, instance, created, **kwargs):
+    if created:
+        site_stats.bump(total_services=1)
+    invalidate_category_facets()
+
+
+@receiver(post_delete, sender=Service)
+def uncount_service(sender, instance, **kwargs):
+    site_stats.bump(total_services=-1)
+    invalidate_category_facets()
+
+
+@receiver(post_save, sender=Provider)
+def count_new_provider(sender, instance, created, **kwargs):
+    if created:
+        site_stats.bump(total_providers=1)
+
+
+@receiver(post_delete, sender=Provider)
+def uncount_provider(sender, instance, **kwargs):
+    site_stats.bump(total_providers=-1)
+
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        site_stats.bump(total_users=1)
+
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    site_stats.bump(total_users=-1)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Provider)
+@receiver(post_delete, sender=Provider)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_public_pages(sender, **kwargs):
+    page_cache.bump_version()
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, **kwargs):
+    unread = not instance.read
+    if unread != instance._counted_unread:
+        notifications.adjust_unread_count(instance.recipient_id, 1 if unread else -1)
+        instance._counted_unread = unread
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_unread_notification(sender, instance, **kwargs):
+    if instance._counted_unread:
+        notifications.adjust_unread_count(instance.recipient_id, -1)
+
+
+@receiver(post_migrate)
+def restore_search_index_triggers(sender, using, **kwargs):
+    # Migrations that rebuild app_service on SQLite drop the triggers
+    if sender.name == 'app':
+        search.ensure_service_index_triggers(using)
+
+
+@receiver(post_migrate)
+def create_cache_table(sender, using, **kwargs):
+    # Table of the shared database cache (settings.CACHES); a no-op for other backends
+    if sender.name == 'app':
+        call_command('createcachetable', database=using, verbosity=0)
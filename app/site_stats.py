@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import SiteStatistics, Booking, Provider, Review, Service
+
+SITE_STATISTICS_ID = 1
+
+
+def get_site_statistics():
+    """Returns the counters row, building it from the tables if it does not exist yet."""
+    try:
+        return SiteStatistics.objects.get(pk=SITE_STATISTICS_ID)
+    except SiteStatistics.DoesNotExist:
+        return reconcile_site_statistics()
+
+
+def bump(**deltas):
+    """Adds the given deltas to the counters in a single UPDATE, e.g. bump(total_users=1)."""
+    SiteStatistics.objects.filter(pk=SITE_STATISTICS_ID).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def record_booking_status(service_id, old_status, new_status):
+    """
+    Counts a booking entering or leaving the completed status. old_status is
+    None for new bookings and new_status is None for deleted ones.
+    """
+    if (old_status == 'completed') == (new_status == 'completed'):
+        return
+    sign = 1 if new_status == 'completed' else -1
+    price = Service.objects.filter(pk=service_id).values_list('price', flat=True).first()
+    bump(completed_bookings=sign, total_revenue=sign * (price or Decimal('0')))
+
+
+@transaction.atomic
+def reconcile_site_statistics():
+    """Recomputes every counter from the source tables and returns the row."""
+    completed = Booking.objects.filter(status='completed')
+    stats, created = SiteStatistics.objects.update_or_create(
+        pk=SITE_STATISTICS_ID,
+        defaults={
+            'total_users': User.objects.count(),
+            'total_providers': Provider.objects.count(),
+            'total_services': Service.objects.count(),
+            'total_reviews': Review.objects.count(),
+            'completed_bookings': completed.count(),
+            'total_revenue': completed.aggregate(total=Sum('service__price'))['total'] or 0,
+        },
+    )
+    return stats
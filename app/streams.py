@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from . import pubsub
+
+# Comment lines sent while idle so proxies don't drop the connection
+HEARTBEAT_INTERVAL = 15
+# Streams end after this many seconds; EventSource reconnects by itself,
+# which also re-checks the session
+MAX_STREAM_AGE = 10 * 60
+
+
+def is_streaming_supported(request):
+    """
+    Long-lived responses only make sense under ASGI. Under WSGI each one would
+    hold a worker thread for its whole lifetime.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def sse_response(stream):
+    return StreamingHttpResponse(
+        stream,
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def event_stream(channel, initial_events=None):
+    """
+    Server-sent events for everything published to `channel`. Messages are
+    expected as {'event': name, 'data': payload}. `initial_events` is an
+    optional coroutine function returning (event, data) pairs to send first;
+    it runs after subscribing so nothing published in between is missed.
+    """
+    subscription = await pubsub.subscribe(channel)
+    loop = asyncio.get_running_loop()
+    try:
+        if initial_events is not None:
+            for event, data in await initial_events():
+                yield sse_event(event, data)
+        deadline = loop.time() + MAX_STREAM_AGE
+        while loop.time() < deadline:
+            message = await subscription.get(timeout=HEARTBEAT_INTERVAL)
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield sse_event(message['event'], message['data'])
+    finally:
+        await subscription.close()
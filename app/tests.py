@@ -1,3 +1,144 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import availability, notifications, wallet
+from .checks import check_shared_cache
+from .facets import category_facet_counts
+from .forms import ProfileForm, ProviderForm
+from .models import Category, Profile, Provider, Review, Service
+from .search import fts_available, search_services
+
+
+class ServiceSearchTests(TestCase):
+    def setUp(self):
+        profile = Profile.objects.create(user=User.objects.create_user('plumber', password='pw'))
+        self.provider = Provider.objects.create(profile=profile)
+        self.category = Category.objects.create(name='Home', description='Home services')
+
+    def search(self, query):
+        return list(search_services(Service.objects.all(), query).values_list('title', flat=True))
+
+    def test_index_follows_service_changes(self):
+        self.assertTrue(fts_available())
+
+        service = Service.objects.create(
+            provider=self.provider, category=self.category, title='Plumbing repairs',
+            description='Leaking pipes fixed', price=Decimal('10'), duration=timedelta(hours=1),
+        )
+        self.assertEqual(self.search('plumb'), ['Plumbing repairs'])
+
+        service.title = 'Gardening'
+        service.save()
+        self.assertEqual(self.search('garden'), ['Gardening'])
+        self.assertEqual(self.search('plumb'), [])
+
+        service.delete()
+        self.assertEqual(self.search('garden'), [])
+
+
+class StaleProfileSaveTests(TestCase):
+    def setUp(self):
+        self.profile = Profile.objects.create(user=User.objects.create_user('customer', password='pw'))
+        self.provider = Provider.objects.create(profile=self.profile)
+
+    def test_profile_form_keeps_deposit_made_while_open(self):
+        form = ProfileForm({'phone': '123', 'location': 'Porto'}, instance=self.profile)
+        wallet.deposit(self.profile, Decimal('50'))
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.wallet, Decimal('50'))
+        self.assertEqual(self.profile.location, 'Porto')
+
+    def test_provider_form_keeps_deposit_made_while_open(self):
+        form = ProviderForm({'phone': '123', 'location': 'Porto', 'about': 'Pipes'}, instance=self.provider)
+        wallet.deposit(self.profile, Decimal('50'))
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.wallet, Decimal('50'))
+        self.assertEqual(self.profile.location, 'Porto')
+
+    def test_profile_form_keeps_notifications_received_while_open(self):
+        form = ProfileForm({'phone': '123', 'location': 'Porto'}, instance=self.profile)
+        notifications.notify(self.profile, "New booking")
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.unread_notifications_count, 1)
+
+    def test_full_save_keeps_notifications_received_meanwhile(self):
+        profile = Profile.objects.get(pk=self.profile.pk)
+        notifications.notify(self.profile, "New booking")
+        profile.location = 'Porto'
+        profile.save()
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.unread_notifications_count, 1)
+        self.assertEqual(profile.location, 'Porto')
+
+    def test_provider_form_keeps_reviews_made_while_open(self):
+        reviewer = Profile.objects.create(user=User.objects.create_user('reviewer', password='pw'))
+        form = ProviderForm({'phone': '123', 'location': 'Porto', 'about': 'Pipes'}, instance=self.provider)
+        Review.objects.create(provider=self.provider, reviewer=reviewer, rating=Decimal('4.0'))
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.rating_count, 1)
+        self.assertEqual(self.provider.rating_average, Decimal('4.00'))
+        self.assertEqual(self.provider.about, 'Pipes')
+
+
+class StaleServiceSaveTests(TestCase):
+    def setUp(self):
+        profile = Profile.objects.create(user=User.objects.create_user('provider', password='pw'))
+        self.service = Service.objects.create(
+            provider=Provider.objects.create(profile=profile),
+            category=Category.objects.create(name='Home', description='Home services'),
+            title='Plumbing', description='Pipes', price=Decimal('10'), duration=timedelta(hours=1),
+        )
+
+    def test_full_save_keeps_popularity_changed_meanwhile(self):
+        service = Service.objects.get(pk=self.service.pk)
+        Service.objects.filter(pk=service.pk).update(popularity=99)
+        service.title = 'Plumbing and heating'
+        service.save()
+
+        service.refresh_from_db()
+        self.assertEqual(service.popularity, 99)
+        self.assertEqual(service.title, 'Plumbing and heating')
+
+
+class AvailabilityQueryTests(TestCase):
+    def test_blocking_bookings_use_the_interval_index(self):
+        start = timezone.now()
+        plan = availability.blocking_bookings(1, start, start + timedelta(days=7)).values_list('scheduled_time', 'ends_at').explain()
+        self.assertIn('booking_interval_idx (service_id=? AND status=? AND ends_at>?)', plan)
+
+
+class CategoryFacetTests(TestCase):
+    def test_cached_counts_follow_approvals(self):
+        profile = Profile.objects.create(user=User.objects.create_user('provider', password='pw'))
+        category = Category.objects.create(name='Home', description='Home services')
+        service = Service.objects.create(
+            provider=Provider.objects.create(profile=profile), category=category,
+            title='Plumbing', description='Pipes', price=Decimal('10'), duration=timedelta(hours=1),
+        )
+        approved = Service.objects.filter(approval='approved')
+        self.assertEqual(category_facet_counts(approved, cacheable=True), {})
+
+        service.approval = 'approved'
+        service.save(update_fields=['approval'])
+        self.assertEqual(category_facet_counts(approved, cacheable=True), {category.id: 1})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['app.W001'])
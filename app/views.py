@@ -1,21 +1,33 @@
 import logging
-from datetime import timedelta
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Q, Avg, OuterRef, Max, Subquery, Sum, Count
-from django.http import JsonResponse, HttpResponseForbidden
+from django.db import transaction
+from django.db.models import Q, Count
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils.timezone import now
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 
+from . import availability, bookings, chats, wallet
+from .facets import category_facet_counts
 from .forms import CustomUserCreationForm, LoginForm, ProfileForm, ReviewForm, CategoryForm, AddBalanceForm, \
     ProviderForm, MessageForm, BookingForm
-from .models import Profile, Provider, Service, Category, Message, Booking, Chat, Notification
+from .leaderboards import ranked_providers, ranked_categories
+from .notifications import dispatch, notification_channel
+from .models import Profile, Provider, ProviderStats, Service, Category, Message, Booking, Chat, Notification
+from .page_cache import anonymous_page_cache
+from .pagination import keyset_paginate, keyset_paginate_groups, page_query
+from .rollups import daily_series
+from .search import search_services
+from .streams import event_stream, is_streaming_supported, sse_response
+from .site_stats import get_site_statistics
 
 logger = logging.getLogger(__name__)
 
@@ -32,14 +44,13 @@ def approve_service(request, service_id):
     if request.method == "POST":
         service = get_object_or_404(Service, id=service_id)
         service.approval = 'approved'
-        service.save()
+        service.save(update_fields=['approval'])
 
-        notification = Notification.objects.create(
-            recipient=service.provider.profile,
+        dispatch(
+            recipients=service.provider.profile,
             message=f"Your service '{service.title}' has been approved by an administrator and is now visible to customers.",
             url = reverse('myservices'),
         )
-        # logger.debug(f"Notification created: {notification}")
 
         return redirect('pendingservices')
 
@@ -50,10 +61,10 @@ def reject_service(request, service_id):
     if request.method == "POST":
         service = get_object_or_404(Service, id=service_id)
         service.approval = 'not approved'
-        service.save()
+        service.save(update_fields=['approval'])
 
-        Notification.objects.create(
-            recipient=service.provider.profile,
+        dispatch(
+            recipients=service.provider.profile,
             message=f"Your service '{service.title}' has been rejected by an administrator.",
             url=reverse('myservices')
         )
@@ -74,6 +85,8 @@ def ban_user(request, user_id):
         user.delete()  # Remove o usuário e, por cascade, o Profile e o Provider (se existir)
         return redirect('users')
 
+MYSERVICES_PAGE_SIZE = 12
+
 def myservices(request):
     user_profile = get_object_or_404(Profile, user=request.user)
     provider = get_object_or_404(Provider, profile=user_profile)
@@ -83,40 +96,77 @@ def myservices(request):
     search_name = request.GET.get('search_name', '').strip()
     filter_status = request.GET.get('filter_status', '').strip()
 
-    # Base queryset com os serviços do provedor
-    user_services = Service.objects.filter(provider=provider)
+    # Base queryset com os serviços do provedor e as contagens de reservas
+    user_services = Service.objects.filter(provider=provider).select_related('category').annotate(
+        bookings_to_approve_count=Count(
+            'booking', filter=Q(booking__status='pending', booking__accepted_at__isnull=True)
+        ),
+        bookings_in_progress_count=Count(
+            'booking', filter=Q(booking__status='in_progress', booking__accepted_at__isnull=False)
+        ),
+    )
 
     # Filtrar por nome de serviço
     if search_name:
         user_services = user_services.filter(title__icontains=search_name)
 
-    # Preparar a lista de serviços com contagens de reservas
-    services_with_counts = []
-    for service in user_services:
-        bookings_to_approve_count = Booking.objects.filter(
-            service=service, status='pending', accepted_at__isnull=True
-        ).count()
-        bookings_in_progress_count = Booking.objects.filter(
-            service=service, status='in_progress', accepted_at__isnull=False
-        ).count()
-
-        # Aplicar filtro por status das reservas
-        if filter_status == 'bookings_to_approve' and bookings_to_approve_count == 0:
-            continue
-        elif filter_status == 'bookings_in_progress' and bookings_in_progress_count == 0:
-            continue
-
-        services_with_counts.append({
-            'service': service,
-            'bookings_to_approve_count': bookings_to_approve_count,
-            'bookings_in_progress_count': bookings_in_progress_count
-        })
+    # Aplicar filtro por status das reservas (HAVING)
+    if filter_status == 'bookings_to_approve':
+        user_services = user_services.filter(bookings_to_approve_count__gt=0)
+    elif filter_status == 'bookings_in_progress':
+        user_services = user_services.filter(bookings_in_progress_count__gt=0)
+
+    page = keyset_paginate(
+        user_services,
+        ('-created_at', '-id'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=MYSERVICES_PAGE_SIZE,
+    )
 
     return render(request, 'myservices.html', {
-        'services_with_counts': services_with_counts,
+        'services': page,
+        'page': page,
+        'page_query': page_query(request),
         'categories': categories,
     })
 
+@login_required
+def provider_booking_stats(request):
+    """
+    Daily bookings and revenue of the logged in provider, for the dashboard
+    charts. With `?status=` the series is for that status only, otherwise
+    each row is for one date and status: a booking is counted once for every
+    status it went through, so the rows must not be added up.
+    """
+    provider = get_object_or_404(Provider, profile__user=request.user)
+
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+    except ValueError:
+        days = 30
+    filters = {'provider': provider}
+    status = request.GET.get('status')
+    if status in dict(Booking.STATUS_CHOICES):
+        filters['status'] = status
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    by_status = 'status' not in filters
+    series = daily_series(since=since, by_status=by_status, **filters)
+    return JsonResponse({
+        'days': days,
+        'status': filters.get('status'),
+        'series': [
+            {
+                'date': row['date'].isoformat(),
+                **({'status': row['status']} if by_status else {}),
+                'count': row['count'],
+                'revenue': str(row['revenue']),
+            }
+            for row in series
+        ],
+    })
+
 def categories(request):
     if not request.user.is_authenticated or not request.user.is_superuser:
         return HttpResponseForbidden("You are not authorized to view this page.")
@@ -131,9 +181,56 @@ def categories(request):
     categories = Category.objects.all()
     return render(request, 'categories.html', {'categories': categories, 'form': form})
 
+# Orderings for the provider directory, keyed by the `sort` URL parameter
+PROVIDER_SORT_ORDERS = {
+    'rating': ('-rating_average', '-id'),
+    'completed': ('-stats_completed', '-id'),
+    'newest': ('-id',),
+}
+
+PROVIDERS_PAGE_SIZE = 24
+
+@anonymous_page_cache
 def providers(request):
-    providers = Provider.objects.all()
-    return render(request, 'providers.html', {'providers': providers})
+    search_query = request.GET.get('search', '').strip()
+    location = request.GET.get('location', '').strip()
+    category_id = request.GET.get('category', '')
+    sort_option = request.GET.get('sort', 'rating')
+    if sort_option not in PROVIDER_SORT_ORDERS:
+        sort_option = 'rating'
+
+    # Every stat shown on the cards comes from this one annotated query
+    providers = ProviderStats.annotate(Provider.objects.select_related('profile__user'))
+
+    if search_query:
+        providers = providers.filter(profile__user__username__icontains=search_query)
+    if location:
+        providers = providers.filter(profile__location__icontains=location)
+    if category_id.isdigit():
+        # Subquery, so the join doesn't restrict the annotated counts to this category
+        providers = providers.filter(
+            pk__in=Service.objects.filter(category_id=category_id, approval='approved').values('provider_id')
+        )
+
+    page = keyset_paginate(
+        providers,
+        PROVIDER_SORT_ORDERS[sort_option],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=PROVIDERS_PAGE_SIZE,
+    )
+    for provider in page:
+        ProviderStats.from_annotated(provider)
+
+    return render(request, 'providers.html', {
+        'providers': page,
+        'page': page,
+        'page_query': page_query(request),
+        'search_query': search_query,
+        'location': location,
+        'category_id': category_id,
+        'sort_option': sort_option,
+    })
 
 
 def edit_service(request, service_id):
@@ -145,11 +242,14 @@ def edit_service(request, service_id):
         service.description = request.POST.get('description')
         service.price = request.POST.get('price')
         service.category_id = request.POST.get('category')
+        # Only the edited columns, so a stale popularity isn't written back
+        edited = ['title', 'description', 'price', 'category']
 
         if 'image' in request.FILES:
             service.image = request.FILES['image']
+            edited.append('image')
 
-        service.save()
+        service.save(update_fields=edited)
         return redirect('myservices')
 
     return render(request, 'myservices.html', {'service': service, 'categories': categories})
@@ -253,118 +353,166 @@ def logout_view(request):
     return redirect('index')
 
 
-def top_categories(limit=5):
-    """Retorna as categorias com mais vendas."""
-    return (
-        Category.objects.annotate(total_sales=Count('service__booking'))
-        .order_by('-total_sales')[:limit]
-    )
+def top_categories(limit=5, window='all'):
+    """Retorna as categorias com mais vendas (último snapshot, ver app/leaderboards.py)."""
+    return ranked_categories(window, limit)
 
-def leaderboard(limit=5):
-    """Retorna os providers com mais vendas (independente do mês)."""
-    return (
-        Provider.objects.annotate(
-            total_sales=Count(
-                'services__booking',
-                filter=Q(services__booking__status='completed')
-            )
-        )
-        .filter(total_sales__gt=0)
-        .order_by('-total_sales')[:limit]
-    )
+def leaderboard(limit=5, window='all'):
+    """Retorna os providers com mais vendas (último snapshot, ver app/leaderboards.py)."""
+    return ranked_providers('provider_sales', window, limit)
 
+@anonymous_page_cache
 def home(request):
-    total_users = User.objects.count()
-    total_services = Service.objects.count()
-    total_reviews = Booking.objects.filter(status='completed').count()
-    total_revenue = Booking.objects.filter(status='completed').aggregate(total=Sum('service__price'))['total'] or 0
-    total_providers = Provider.objects.count()
-    total_services_provided = Booking.objects.filter(status='completed').count()
+    stats = get_site_statistics()
 
     context = {
-        'total_users': total_users,
-        'total_services': total_services,
-        'total_reviews': total_reviews,
-        'total_revenue': total_revenue,
-        'total_providers': total_providers,
-        'total_services_provided': total_services_provided,
-        'recent_bookings': Booking.objects.order_by('-created_at')[:5],
-        'providers': Provider.objects.annotate(total_sales=Count('services__booking')).order_by('-total_sales')[:3],
+        'total_users': stats.total_users,
+        'total_services': stats.total_services,
+        'total_reviews': stats.total_reviews,
+        'total_revenue': stats.total_revenue,
+        'total_providers': stats.total_providers,
+        'total_services_provided': stats.completed_bookings,
+        'recent_bookings': Booking.objects.select_related('service', 'customer__user').order_by('-created_at')[:5],
+        'providers': ranked_providers('provider_bookings', limit=3),
     }
 
     return render(request, 'index.html', context)
 
+MYORDERS_PAGE_SIZE = 12
+
+
 def myorders(request):
     # Ensure the user is authenticated
     if not request.user.is_authenticated:
         return redirect('login')
 
-    # Get bookings grouped by status
-    pending_bookings = Booking.objects.filter(customer=request.user.profile, status='pending').select_related('service', 'service__provider')
-    in_progress_bookings = Booking.objects.filter(customer=request.user.profile, status='in_progress').select_related('service', 'service__provider')
-    completed_bookings = Booking.objects.filter(customer=request.user.profile, status='completed').select_related('service', 'service__provider')
-    cancelled_bookings = Booking.objects.filter(customer=request.user.profile, status='cancelled').select_related('service', 'service__provider')
+    # Every status gets its own page of bookings, each with its own
+    # `<status>_after` / `<status>_before` cursors, all read in one query
+    statuses = [status for status, label in Booking.STATUS_CHOICES]
+    pages = keyset_paginate_groups(
+        Booking.objects.filter(customer=request.user.profile)
+        .select_related('service__provider__profile__user', 'customer__user'),
+        'status',
+        {status: (request.GET.get(f'{status}_after'), request.GET.get(f'{status}_before')) for status in statuses},
+        ('-created_at', '-id'),
+        page_size=MYORDERS_PAGE_SIZE,
+    )
 
     context = {
-        'pending_bookings': pending_bookings,
-        'in_progress_bookings': in_progress_bookings,
-        'completed_bookings': completed_bookings,
-        'cancelled_bookings': cancelled_bookings,
+        f'{status}_bookings': {
+            'page': pages[status],
+            'page_query': page_query(request, f'{status}_after', f'{status}_before'),
+            'after_param': f'{status}_after',
+            'before_param': f'{status}_before',
+        }
+        for status in statuses
     }
     return render(request, 'myorders.html', context)
 
+# Orderings for the services listing, keyed by the `sort` URL parameter.
+# Each ends with the primary key so keyset cursors are stable.
+SERVICE_SORT_ORDERS = {
+    '0': ('-created_at', '-id'),  # Most Recent
+    '1': ('-popularity', '-id'),  # Most Popular
+    '2': ('price', 'id'),  # Price: Low to High
+    '3': ('-price', '-id'),  # Price: High to Low
+    '4': ('search_rank', '-id'),  # Best Match
+}
+
+# Columns the service cards in services.html actually render
+SERVICE_CARD_FIELDS = (
+    'id', 'title', 'description', 'price', 'image', 'created_at',
+    'category', 'category__name',
+    'provider', 'provider__profile', 'provider__profile__avatar',
+    'provider__profile__user', 'provider__profile__user__username',
+    'provider__rating_average',
+)
+
+SERVICES_PAGE_SIZE = 24
+
+def parse_price(value):
+    """Parses a price filter from the query string, ignoring empty or invalid values."""
+    try:
+        price = Decimal(value)
+    except (TypeError, InvalidOperation):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+@anonymous_page_cache
 def services(request):
     # Get filter parameters from request
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
     category_id = request.GET.get('category', '0')
-    sort_option = request.GET.get('sort', '0')
+    # Searches are ordered by relevance unless another order is picked
+    sort_option = request.GET.get('sort', '4' if search_query else '0')
+
+    min_price = parse_price(request.GET.get('min_price'))
+    max_price = parse_price(request.GET.get('max_price'))
 
     # Start with approved services only
-    services = Service.objects.filter(approval='approved').select_related(
+    services = Service.objects.filter(approval='approved', is_active=True).select_related(
         'provider',
         'provider__profile',
         'provider__profile__user',
         'category'
-    ).prefetch_related('provider__reviews')
+    ).only(*SERVICE_CARD_FIELDS)
 
     # Filter by search query
     if search_query:
-        services = services.filter(
-            Q(title__icontains=search_query) | Q(description__icontains=search_query)
-        )
+        services = search_services(services, search_query)
+    elif sort_option == '4':
+        sort_option = '0'
+
+    # Filter by price range
+    if min_price is not None:
+        services = services.filter(price__gte=min_price)
+    if max_price is not None:
+        services = services.filter(price__lte=max_price)
+
+    # Category counts ignore the selected category, so the other ones stay useful
+    unfiltered = not search_query and min_price is None and max_price is None
+    category_counts = category_facet_counts(services, cacheable=unfiltered)
 
     # Filter by category if selected
     if category_id and category_id != '0':
         services = services.filter(category_id=category_id)
 
-    # Apply sorting
-    if sort_option == '1':  # Most Popular
-        services = services.order_by('-popularity')
-    elif sort_option == '2':  # Price: Low to High
-        services = services.order_by('price')
-    elif sort_option == '3':  # Price: High to Low
-        services = services.order_by('-price')
-    else:  # Most Recent
-        services = services.order_by('-created_at')
+    if sort_option not in SERVICE_SORT_ORDERS:
+        sort_option = '0'
 
-    services = services.annotate(avg_rating=Avg('provider__reviews__rating'))
+    # Keyset pagination: cursors carry the sort values of the first/last card
+    page = keyset_paginate(
+        services,
+        SERVICE_SORT_ORDERS[sort_option],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=SERVICES_PAGE_SIZE,
+    )
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.service_count = category_counts.get(category.id, 0)
 
-    categories = Category.objects.all()
     context = {
         'title': 'Services',
-        'services': services,
+        'services': page,
+        'page': page,
+        'page_query': page_query(request),
         'categories': categories,
+        'total_count': sum(category_counts.values()),
         'search_query': search_query,
         'category_id': category_id,
         'sort_option': sort_option,
+        'min_price': min_price,
+        'max_price': max_price,
     }
     return render(request, 'services.html', context)
 
+@anonymous_page_cache
 def service_detail(request, service_id):
     service = get_object_or_404(Service, id=service_id, is_active=True, approval='approved')
 
-    # Calcular a média das avaliações do provedor
-    avg_rating = service.provider.reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
+    avg_rating = service.provider.rating_average
     booking_form = BookingForm()
 
     context = {
@@ -374,6 +522,42 @@ def service_detail(request, service_id):
     }
     return render(request, 'service_detail.html', context)
 
+# Days of open slots returned by service_slots, by default and at most
+SLOT_DAYS = 7
+MAX_SLOT_DAYS = 31
+
+
+def service_slots(request, service_id):
+    """
+    Open booking slots of a service as JSON, for `?days=` days (default
+    SLOT_DAYS) from `?date=YYYY-MM-DD` (default today).
+    """
+    service = get_object_or_404(Service, id=service_id, is_active=True, approval='approved')
+    today = timezone.localdate()
+    try:
+        first_day = date.fromisoformat(request.GET['date']) if request.GET.get('date') else today
+        days = int(request.GET.get('days') or SLOT_DAYS)
+    except ValueError:
+        return JsonResponse({'error': "Invalid date or number of days."}, status=400)
+    first_day = max(first_day, today)
+    days = min(max(days, 1), MAX_SLOT_DAYS)
+
+    slots = availability.open_slots(service, first_day, days)
+    return JsonResponse({
+        'duration_minutes': int(service.duration.total_seconds() // 60),
+        'days': [
+            {
+                'date': day.isoformat(),
+                'slots': [
+                    {'start': timezone.localtime(start).strftime('%Y-%m-%dT%H:%M'), 'label': timezone.localtime(start).strftime('%H:%M')}
+                    for start in starts
+                ],
+            }
+            for day, starts in slots.items()
+        ],
+    })
+
+
 def booking(request):
     return render(request, 'booking.html')
 
@@ -393,7 +577,7 @@ def profile(request, username):
     provider = user_profile.provider if hasattr(user_profile, 'provider') else None
     is_provider = provider is not None
     approved_services = provider.services.filter(approval='approved') if is_provider else None
-    avg_rating = provider.reviews.aggregate(Avg('rating'))['rating__avg'] if is_provider else None
+    avg_rating = provider.average_rating() if is_provider else None
     reviews = provider.reviews.all() if is_provider else None
 
     if request.method == 'POST':
@@ -417,10 +601,11 @@ def profile(request, username):
                 review.reviewer = request.user.profile
                 review.save()
 
-                Notification.objects.create(
-                    recipient=user_profile.provider.profile,
+                dispatch(
+                    recipients=user_profile.provider.profile,
                     message=f"You have received a new review from {request.user.username} for the service '{review.provider.services.first().title}'.",
-                    url=reverse('profile', kwargs={'username': user_profile.user.username})
+                    url=reverse('profile', kwargs={'username': user_profile.user.username}),
+                    collapse_key=f"reviews:{review.provider_id}",
                 )
 
                 return redirect('profile', username=username)
@@ -429,8 +614,7 @@ def profile(request, username):
             add_balance_form = AddBalanceForm(request.POST)
             if add_balance_form.is_valid():
                 amount = add_balance_form.cleaned_data['amount']
-                user_profile.wallet += amount
-                user_profile.save()
+                wallet.deposit(user_profile, amount)
                 return redirect('profile', username=username)
 
     context = {
@@ -449,70 +633,161 @@ def profile(request, username):
 
 @login_required
 def chat_view(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(
+        Booking.objects.select_related('customer__user', 'service__category', 'service__provider__profile__user'),
+        id=booking_id,
+    )
     chat, created = Chat.objects.get_or_create(booking=booking)
 
     # Ensure only the customer or provider can access the chat
-    if request.user.profile not in [booking.customer, booking.service.provider.profile]:
+    if not chats.is_participant(booking, request.user.profile):
         messages.error(request, "You are not authorized to access this chat.")
         return redirect('home')
 
-    # Rename the variable to avoid conflicts with Django messages
-    chat_messages = chat.messages.order_by('timestamp')
-
     if request.method == "POST":
         form = MessageForm(request.POST)
         if form.is_valid():
             message = form.save(commit=False)
             message.chat = chat
             message.sender = request.user.profile
-            message.recipient = (
-                booking.service.provider.profile
-                if request.user.profile == booking.customer
-                else booking.customer
-            )
+            message.recipient = chats.other_participant(booking, request.user.profile)
             message.save()
 
-            Notification.objects.create(
-                recipient=message.recipient,
-                message=f"{message.sender.user.username} sent a new message in the chat for the service '{booking.service.title}'.",
-                url = reverse('chat_view', kwargs={'booking_id': booking.id})
-            )
+            chats.publish_message(message, request.user.username)
+            chats.notify_recipient(booking.id, chat.id, message.recipient.id, request.user.username, booking.service.title)
 
             messages.success(request, "Message sent successfully.")
             return redirect('chat_view', booking_id=booking.id)
     else:
         form = MessageForm()
 
+    # Only the latest messages, older ones are loaded on scroll via chat_messages
+    # Rename the variable to avoid conflicts with Django messages
+    chat_messages, has_more_history = chats.message_window(chat)
+    chats.mark_read(chat, request.user.profile)
+
     context = {
         'chat': chat,
         'booking': booking,
         'chat_messages': chat_messages,
+        'has_more_history': has_more_history,
         'form': form,
     }
     return render(request, 'chat.html', context)
 
 
+@login_required
+@require_http_methods(["POST"])
+def chat_send(request, booking_id):
+    """
+    Sends a chat message without reloading the page. The message is saved in
+    the background and reaches both participants through chat_stream.
+    """
+    booking = get_object_or_404(
+        Booking.objects.select_related('customer__user', 'service__provider__profile__user'),
+        id=booking_id,
+    )
+    if not chats.is_participant(booking, request.user.profile):
+        return JsonResponse({'error': "You are not authorized to access this chat."}, status=403)
+
+    form = MessageForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    chat, created = Chat.objects.get_or_create(booking=booking)
+    chats.send_message(booking, chat, request.user.profile, form.cleaned_data['content'])
+    return JsonResponse({'queued': True}, status=202)
+
+
+@login_required
+async def chat_stream(request, booking_id):
+    # Server-sent events with the chat's new messages
+    if not is_streaming_supported(request):
+        # 204 tells EventSource not to reconnect, the page falls back to polling
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    profile = await Profile.objects.aget(user=user)
+    chat = await Chat.objects.select_related('booking__service__provider').filter(booking_id=booking_id).afirst()
+    if chat is None or not chats.is_participant(chat.booking, profile):
+        return HttpResponseForbidden("You are not authorized to access this chat.")
+
+    async def initial_events():
+        # Sent once subscribed, so the page knows it can catch up without missing anything
+        return [('ready', {})]
+
+    return sse_response(event_stream(chats.chat_channel(chat.id), initial_events))
+
+
+def parse_message_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+@login_required
+def chat_messages(request, booking_id):
+    """
+    A page of chat messages as JSON: `?after=<id>` for messages newer than
+    the given one, `?before=<id>` for older history, neither for the latest.
+    """
+    chat = get_object_or_404(Chat.objects.select_related('booking__service__provider'), booking_id=booking_id)
+    if not chats.is_participant(chat.booking, request.user.profile):
+        return JsonResponse({'error': "You are not authorized to access this chat."}, status=403)
+
+    before = parse_message_id(request.GET.get('before'))
+    window, has_more = chats.message_window(chat, after=parse_message_id(request.GET.get('after')), before=before)
+    if before is None:
+        # New messages are now on screen
+        chats.mark_read(chat, request.user.profile)
+    return JsonResponse({
+        'messages': [chats.serialize_message(message) for message in window],
+        'has_more': has_more,
+    })
+
+
+THREAD_PAGE_SIZE = 50
+
+
+@login_required
 def message_thread(request, recipient_id):
-    recipient = get_object_or_404(Profile, id=recipient_id)
-    messages = Message.objects.filter(
-        (Q(sender=request.user.profile) & Q(recipient=recipient)) |
-        (Q(sender=recipient) & Q(recipient=request.user.profile))
-    ).order_by('timestamp')
+    recipient = get_object_or_404(Profile.objects.select_related('user'), id=recipient_id)
+    profile = request.user.profile
+    conversation = Message.conversation_key(profile.id, recipient.id)
 
     if request.method == 'POST':
         form = MessageForm(request.POST)
-        if form.is_valid():
+        # Messages belong to a booking chat, so post in the latest one between the two
+        chat = Chat.objects.filter(
+            Q(booking__customer=profile, booking__service__provider__profile=recipient) |
+            Q(booking__customer=recipient, booking__service__provider__profile=profile)
+        ).order_by('-id').first()
+        if chat is None:
+            form.add_error(None, "You can only message users you have a booking with.")
+        elif form.is_valid():
             message = form.save(commit=False)
-            message.sender = request.user.profile
+            message.chat = chat
+            message.sender = profile
             message.recipient = recipient
             message.save()
             return redirect('message_thread', recipient_id=recipient_id)
     else:
         form = MessageForm()
 
+    # Newest page first; a single range scan of the (conversation, timestamp) index
+    page = keyset_paginate(
+        Message.objects.filter(conversation=conversation).select_related('sender__user'),
+        ('-timestamp', '-id'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=THREAD_PAGE_SIZE,
+    )
+
     context = {
-        'messages': messages,
+        'thread_messages': page.items[::-1],
+        'page': page,
+        'page_query': page_query(request),
         'form': form,
         'recipient': recipient,
     }
@@ -551,27 +826,32 @@ def book_service(request, service_id):
                 messages.error(request, "You cannot book a service in the past. Please select a valid time.")
                 return redirect('service_detail', service_id=service_id)
 
-            # Check if the user has enough balance
-            if user_profile.wallet < service.price:
+            # Create the booking, claim its time slot and pay for it together;
+            # if the slot is taken or the balance doesn't cover the price when
+            # it is written, none of it happens
+            try:
+                with transaction.atomic():
+                    booking = form.save(commit=False)
+                    booking.service = service
+                    booking.customer = user_profile
+                    booking.save()
+                    availability.reserve(booking)
+                    wallet.charge(user_profile, service.price, booking=booking)
+            except availability.SlotUnavailable as e:
+                messages.error(request, f"{e} Please choose one of the available times.")
+                return redirect('service_detail', service_id=service_id)
+            except wallet.InsufficientFunds:
                 messages.error(request, "You don't have enough balance to book this service. Please add funds to your wallet.")
                 return redirect('service_detail', service_id=service_id)
 
-            user_profile.wallet -= service.price
-            user_profile.save()
-
-            # Create the booking
-            booking = form.save(commit=False)
-            booking.service = service
-            booking.customer = user_profile
-            booking.save()
-
             # Notify the provider
-            Notification.objects.create(
-                recipient=service.provider.profile,
+            dispatch(
+                recipients=service.provider.profile,
                 message=f"New booking for the service '{service.title}'.",
                 booking=booking,
                 action_required=True,
                 url=reverse('pending_bookings', kwargs={'service_id': service.id}),
+                collapse_key=f"service-bookings:{service.id}",
             )
             messages.success(request, "Booking successful! Your request has been sent to the provider.")
             return redirect('service_detail', service_id=service_id)
@@ -584,36 +864,31 @@ def book_service(request, service_id):
 
     return render(request, 'service_detail.html', {'service': service, 'form': form})
 
+# Everything the booking transitions need for their side effects
+BOOKING_TRANSITION_RELATED = ('service__provider__profile', 'customer')
+
+
 @login_required
 def update_booking_status(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related(*BOOKING_TRANSITION_RELATED), id=booking_id)
 
     if request.user.profile != booking.customer:
         messages.error(request, "You do not have permission to change the status of this booking.")
         return redirect('profile', username=request.user.username)
 
-    if not booking.accepted_at:
+    if bookings.transition(booking, 'complete'):
+        messages.success(request, "Booking status updated to 'completed' and amount deposited in wallet.")
+    elif booking.status == 'completed':
+        messages.info(request, "This booking has already been marked as completed.")
+    else:
         messages.warning(request, "This booking has not been accepted by the provider yet.")
         return redirect('profile', username=request.user.username)
 
-    if booking.status != 'completed':
-        booking.status = 'completed'
-        booking.save()
-
-        provider_profile = booking.service.provider.profile
-        provider_profile.wallet += booking.service.price
-        provider_profile.save()
-
-        Notification.objects.create(
-            recipient=provider_profile,
-            message=f"The booking for the service '{booking.service.title}' has been marked as completed by the customer."
-        )
+    return redirect('myorders')
 
-        messages.success(request, "Booking status updated to 'completed' and amount deposited in wallet.")
-    else:
-        messages.info(request, "This booking has already been marked as completed.")
 
-    return redirect('myorders')
+NOTIFICATION_ORDERING = ('read', '-updated_at', '-id')
+NOTIFICATIONS_PAGE_SIZE = 30
 
 
 @login_required
@@ -621,37 +896,49 @@ def notifications(request):
     user_profile = Profile.objects.get(user=request.user)
 
     # Count unread notifications
-    unread_notifications_count = user_profile.notifications.filter(read=False).count()
-
-    # Get representative notifications with a count
-    representative_ids = Notification.objects.filter(
-        message=OuterRef('message'),
-        read=OuterRef('read'),
-        recipient=user_profile
-    ).values('id')[:1]
-
-    notifications = (
-        user_profile.notifications
-        .values('message', 'read', 'url')
-        .annotate(
-            count=Count('id'),
-            latest_created_at=Max('created_at'),
-            representative_id=Subquery(representative_ids),
-        )
-        .order_by('read', '-latest_created_at')
+    unread_notifications_count = user_profile.unread_notifications_count
+
+    # Unread first, newest activity first; served straight from the
+    # (recipient, read, updated_at) index since grouping happens on write
+    page = keyset_paginate(
+        user_profile.notifications.all(),
+        NOTIFICATION_ORDERING,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=NOTIFICATIONS_PAGE_SIZE,
     )
 
     return render(request, 'notifications.html', {
-        'notifications': notifications,
+        'notifications': page,
+        'page': page,
+        'page_query': page_query(request),
         'unread_notifications_count': unread_notifications_count,
     })
 
 
+@login_required
+async def notification_stream(request):
+    # Server-sent events with the unread counter and new notifications, so
+    # open pages don't have to be reloaded to see them
+    if not is_streaming_supported(request):
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    profile_id = await Profile.objects.filter(user=user).values_list('pk', flat=True).aget()
+
+    async def initial_events():
+        unread = await Profile.objects.filter(pk=profile_id).values_list('unread_notifications_count', flat=True).aget()
+        return [('notifications', {'unread': unread, 'notification': None})]
+
+    return sse_response(event_stream(notification_channel(profile_id), initial_events))
+
+
 @login_required
 def mark_notification_as_read(request, notification_id):
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user.profile)
     notification.read = True
-    notification.save()
+    notification.save(update_fields=['read'])
     messages.success(request, "Notification marked as read.")
 
     # Redirect to the provided URL if it exists
@@ -673,49 +960,36 @@ def in_progress_bookings(request, service_id):
 
 @login_required
 def accept_booking(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, service__provider__profile__user=request.user)
-
-    # Update the booking status and approval
-    booking.accepted_at = timezone.now()
-    booking.status = 'in_progress'
-    booking.save()
-
-    Notification.objects.create(
-        recipient=booking.customer,
-        message=f"Your request for the service '{booking.service.title}' has been accepted by the provider and is now in progress.",
-        url = reverse('myorders')
+    booking = get_object_or_404(
+        Booking.objects.select_related(*BOOKING_TRANSITION_RELATED),
+        id=booking_id, service__provider__profile__user=request.user,
     )
 
-    # Confirmation message
-    messages.success(request, "Booking accepted successfully.")
+    if bookings.transition(booking, 'accept'):
+        messages.success(request, "Booking accepted successfully.")
+    else:
+        messages.warning(request, "This booking is no longer pending.")
     return redirect('pending_bookings', service_id=booking.service.id)
 
 @login_required
 def reject_booking(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, service__provider__profile__user=request.user)
-    booking.status = 'cancelled'
-    booking.save()
-
-    Notification.objects.create(
-        recipient=booking.customer,
-        message=f"Your request for the service '{booking.service.title}' was rejected by the provider.",
-        url = reverse('myorders')
+    booking = get_object_or_404(
+        Booking.objects.select_related(*BOOKING_TRANSITION_RELATED),
+        id=booking_id, service__provider__profile__user=request.user,
     )
 
-    messages.success(request, "Booking rejected successfully.")
+    if bookings.transition(booking, 'reject'):
+        messages.success(request, "Booking rejected successfully.")
+    else:
+        messages.warning(request, "This booking is no longer pending.")
     return redirect('pending_bookings', service_id=booking.service.id)
 
 def user_chats(request):
     profile = request.user.profile
-    customer_chats = Chat.objects.filter(
-        booking__customer=profile,
-        booking__status='in_progress'
-    ).select_related('booking__service', 'booking__service__provider')
-
-    provider_chats = Chat.objects.filter(
-        booking__service__provider__profile=profile,
-        booking__status='in_progress'
-    ).select_related('booking__customer')
+    # One query for both roles, with unread counts and last message previews
+    active_chats = list(chats.active_chats(profile))
+    customer_chats = [chat for chat in active_chats if chat.booking.customer_id == profile.id]
+    provider_chats = [chat for chat in active_chats if chat.booking.customer_id != profile.id]
 
     context = {
         'customer_chats': customer_chats,
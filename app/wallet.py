@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+
+from .models import Profile, WalletSnapshot, WalletTransaction
+
+# Balances only ever change through these functions: each one moves
+# Profile.wallet with a single UPDATE ... SET wallet = wallet + amount (never a
+# read-modify-write in Python) and appends the matching ledger row in the same
+# transaction, so concurrent requests can't lose money.
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _record(profile, amount, kind, booking=None, require_funds=False):
+    profile_id = getattr(profile, 'pk', profile)
+    with transaction.atomic():
+        balances = Profile.objects.filter(pk=profile_id)
+        if require_funds:
+            # Only succeeds if the balance still covers the debit when the row is written
+            balances = balances.filter(wallet__gte=-amount)
+        if not balances.update(wallet=F('wallet') + amount):
+            raise InsufficientFunds()
+        return WalletTransaction.objects.create(profile_id=profile_id, kind=kind, amount=amount, booking=booking)
+
+
+def deposit(profile, amount):
+    return _record(profile, amount, 'deposit')
+
+
+def charge(profile, amount, booking=None):
+    """Takes `amount` from the wallet, raising InsufficientFunds if the balance doesn't cover it."""
+    return _record(profile, -amount, 'booking_payment', booking, require_funds=True)
+
+
+def pay_out(profile, amount, booking=None):
+    return _record(profile, amount, 'booking_payout', booking)
+
+
+def refund(profile, amount, booking=None):
+    return _record(profile, amount, 'refund', booking)
+
+
+def amount_paid(booking):
+    """What the customer was charged for `booking`: its ledger payment, or the service price for older bookings."""
+    paid = booking.wallet_transactions.filter(kind='booking_payment').aggregate(total=Sum('amount'))['total']
+    return -paid if paid is not None else booking.service.price
+
+
+def snapshot_balances():
+    """
+    Records, for every profile whose balance changed since the last run, its
+    balance as of the newest ledger entry. Returns (snapshots taken, ids of
+    profiles whose wallet doesn't match its ledger).
+    """
+    with transaction.atomic():
+        previous = WalletSnapshot.objects.aggregate(last=Max('last_transaction_id'))['last'] or 0
+        last = WalletTransaction.objects.aggregate(last=Max('id'))['last'] or 0
+        changes = dict(
+            WalletTransaction.objects.filter(id__gt=previous, id__lte=last)
+            .values('profile').annotate(total=Sum('amount')).values_list('profile', 'total')
+        )
+        # Latest snapshot of each changed profile, to add the changes to
+        latest = (
+            WalletSnapshot.objects.filter(profile=OuterRef('profile'))
+            .order_by('-last_transaction_id').values('last_transaction_id')[:1]
+        )
+        balances = dict(
+            WalletSnapshot.objects.filter(profile__in=changes, last_transaction_id=Subquery(latest))
+            .values_list('profile', 'balance')
+        )
+
+        snapshots = [
+            WalletSnapshot(profile_id=profile_id, balance=balances.get(profile_id, 0) + total, last_transaction_id=last)
+            for profile_id, total in changes.items()
+        ]
+        WalletSnapshot.objects.bulk_create(snapshots)
+
+        wallets = dict(Profile.objects.filter(pk__in=changes).values_list('pk', 'wallet'))
+        mismatched = [snapshot.profile_id for snapshot in snapshots if wallets.get(snapshot.profile_id) != snapshot.balance]
+    return len(snapshots), mismatched